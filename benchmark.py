@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+import json
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+from mips import Mips
+from functional import FunctionalMips
+from instructions import Instruction
+from interpreter import Interpreter, RE_LABEL, _instructions
+from program import Program
+from cache import ProgramCache
+
+REPEAT = 3
+
+LOOP = """addi R2,R0,%d
+addi R3,R0,%d
+OUTER:
+addi R1,R0,0
+LOOP:
+addi R1,R1,1
+ble R1,R2,LOOP
+addi R4,R4,1
+ble R4,R3,OUTER"""
+
+EXAMPLES = ["mips_code/example.txt", "mips_code/test2.txt", "mips_code/sum.txt"]
+
+
+def load_program(filename):
+    return file(filename).read()
+
+def best_of(function, number):
+    return min(timeit.repeat(function, repeat=REPEAT, number=number)) / number
+
+def bench_fetch(program):
+    lines = [line for line in program.split("\n") if line.strip()]
+    templates = [Instruction.decode(line) for line in lines]
+
+    parse = best_of(lambda: [Instruction(line) for line in lines], 2000) / len(lines)
+    predecoded = best_of(lambda: [template() for template in templates], 2000) / len(lines)
+    print "fetch, parse bytecode:      %8.2f us/instruction" % (parse * 1e6)
+    print "fetch, predecoded template: %8.2f us/instruction" % (predecoded * 1e6)
+
+def instruction_size(instruction):
+    """Bytes held by one in-flight instruction, excluding class-shared data."""
+    size = sys.getsizeof(instruction)
+    names = set(getattr(instruction, "__dict__", {}))
+    for cls in type(instruction).__mro__:
+        names.update(getattr(cls, "__slots__", ()))
+    if hasattr(instruction, "__dict__"):
+        size += sys.getsizeof(instruction.__dict__)
+    for name in names:
+        value = getattr(instruction, name, None)
+        if isinstance(value, (dict, list)) and value is not getattr(type(instruction), name, None):
+            size += sys.getsizeof(value)
+    return size
+
+def bench_instruction(program):
+    line = program.split("\n")[0]
+    instruction = Instruction(line)
+    setup = "from instructions import Instruction; instruction = Instruction(%r)" % line
+    access = min(timeit.repeat("instruction.rs", setup, repeat=REPEAT, number=1000000)) / 1000000
+    print "instruction: %d bytes in flight, %.1f ns per attribute read" % (
+        instruction_size(instruction), access * 1e9)
+
+def bench_run(program):
+    cycles = Mips(program)
+    cycles.run()
+    cycles = cycles.clock
+
+    def run():
+        Mips(program).run()
+
+    elapsed = best_of(run, 50)
+    print "Mips.run: %d cycles, %10.0f cycles/sec" % (cycles, cycles / elapsed)
+
+def bench_stats(program):
+    def run():
+        Mips(program).run()
+
+    def run_stats_only():
+        Mips(program).run(record_history=False)
+
+    full = best_of(run, 50)
+    stats_only = best_of(run_stats_only, 50)
+    print "Mips.run, full history: %8.2f ms" % (full * 1e3)
+    print "Mips.run, stats only:   %8.2f ms (%.1fx)" % (stats_only * 1e3, full / stats_only)
+
+def bench_history(program):
+    full = Mips(program)
+    full.run()
+    delta = Mips(program, delta_history=True)
+    delta.run()
+
+    print "history, full states: %8d bytes of JSON" % len(json.dumps(full.history))
+    print "history, delta:       %8d bytes of JSON" % len(json.dumps(delta.history.serialize()))
+
+def bench_load(program, size=100000):
+    lines = [line.strip() for line in program.split("\n") if line.strip()]
+    lines = (lines * (size // len(lines) + 1))[:size]
+    text = "\n".join(lines)
+    packed = Program([int(line[:32], 2) for line in lines],
+                     [line.split(";", 1)[1].strip() for line in lines]).to_bytes()
+
+    from_text = best_of(lambda: Mips(text), 1)
+    from_packed = best_of(lambda: Mips(buffer(packed)), 1)
+    print "load %d instructions, text:   %8.2f ms" % (size, from_text * 1e3)
+    print "load %d instructions, packed: %8.2f ms (%.1fx)" % (size, from_packed * 1e3,
+                                                             from_text / from_packed)
+
+def assembly(filename):
+    """Assembly lines of a mips_code example, without its C and bytecode listings."""
+    lines = [line.strip() for line in file(filename)]
+    return [line for line in lines
+            if RE_LABEL.match(line) or line.split(" ")[0].lower() in _instructions]
+
+def assembler_source(size):
+    """About `size` lines of example code, with labels renamed per copy."""
+    examples = [assembly(filename) for filename in EXAMPLES]
+    lines = []
+    copy = 0
+    while len(lines) < size:
+        for index, example in enumerate(examples):
+            labels = [line[:-1] for line in example if RE_LABEL.match(line)]
+            rename = re.compile(r"\b(%s)\b" % "|".join(labels)) if labels else None
+            suffix = "_%d_%d" % (copy, index)
+            lines.extend(rename.sub(lambda match: match.group(1) + suffix, line) if rename else line
+                         for line in example)
+        copy += 1
+    return "\n".join(lines)
+
+def bench_assembler(size=100000):
+    source = assembler_source(size)
+    lines = source.count("\n") + 1
+
+    def compile_text():
+        interpreter = Interpreter(source)
+        interpreter.compile()
+        return str(interpreter)
+
+    def compile_program():
+        interpreter = Interpreter(source)
+        interpreter.compile()
+        return interpreter.program()
+
+    def assemble_stream():
+        Interpreter().assemble(iter(source.split("\n")), tempfile.TemporaryFile())
+
+    text = best_of(compile_text, 1)
+    program = best_of(compile_program, 1)
+    stream = best_of(assemble_stream, 1)
+    print "assembler, %d lines to text:   %10.0f lines/sec" % (lines, lines / text)
+    print "assembler, %d lines to packed: %10.0f lines/sec" % (lines, lines / program)
+    print "assembler, %d lines streamed:  %10.0f lines/sec" % (lines, lines / stream)
+
+def bench_program_cache(size=100000):
+    source = assembler_source(size)
+    directory = tempfile.mkdtemp()
+    try:
+        cache = ProgramCache(directory)
+
+        def compile_and_decode():
+            interpreter = Interpreter(source)
+            interpreter.compile()
+            interpreter.program().decode()
+
+        cold = best_of(compile_and_decode, 1)
+        cache.assemble(source)
+        hit = best_of(lambda: cache.assemble(source), 1)
+    finally:
+        shutil.rmtree(directory)
+    print "program cache, %d lines: compile %8.2f ms, hit %8.2f ms (%.1fx)" % (
+        size, cold * 1e3, hit * 1e3, cold / hit)
+
+def loop_program(iterations, outer_iterations=0):
+    interpreter = Interpreter(LOOP % (iterations, outer_iterations))
+    interpreter.compile()
+    return str(interpreter)
+
+def bench_functional(iterations=30000):
+    program = loop_program(iterations)
+
+    pipelined = best_of(lambda: Mips(program).run(life=10 ** 9, record_history=False), 1)
+    functional = FunctionalMips(program)
+    functional.run()
+    instructions = functional.instructions_completed
+    functional = best_of(lambda: FunctionalMips(program).run(), 1)
+
+    print "loop of %d instructions:" % instructions
+    print "  pipelined, stats only: %10.0f instructions/sec" % (instructions / pipelined)
+    print "  functional:            %10.0f instructions/sec" % (instructions / functional)
+
+def bench_functional_large(iterations=30000, outer_iterations=50):
+    program = loop_program(iterations, outer_iterations)
+    functional = FunctionalMips(program)
+    functional.run()
+    elapsed = best_of(lambda: FunctionalMips(program).run(), 1)
+    print "functional, %d instructions: %10.0f instructions/sec" % (
+        functional.instructions_completed, functional.instructions_completed / elapsed)
+
+def main(filename="mips_code/sum_bytecode.txt"):
+    program = load_program(filename)
+    print "benchmark: %s" % filename
+    bench_fetch(program)
+    bench_instruction(program)
+    bench_run(program)
+    bench_stats(program)
+    bench_history(program)
+    bench_load(program)
+    bench_assembler()
+    bench_program_cache()
+    bench_functional()
+    bench_functional_large()
+
+
+if __name__ == "__main__":
+    import sys
+    main(*sys.argv[1:])
@@ -0,0 +1,289 @@
+import errno
+import hashlib
+import os
+import sqlite3
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from interpreter import Interpreter, ASSEMBLER_VERSION
+from mips import program_lines
+from program import Program, VERSION as PROGRAM_VERSION
+
+MAX_BYTES = 64 * 1024 * 1024
+# fraction of max_bytes the program cache is trimmed down to when over it
+LOW_WATER = 0.75
+SUFFIX = ".program"
+# size of the packed program at the start of a cache entry
+ENTRY = struct.Struct("<I")
+RESULTS_MAX_BYTES = 32 * 1024 * 1024
+TOUCH_BATCH = 64 # memory hits recorded before their access times are written
+# bump when simulation results change, to invalidate persisted ones
+RESULTS_VERSION = 2
+
+
+def normalized(text):
+    """Program text without the blank lines and indentation both parsers ignore."""
+    text = "\n".join(line.strip() for line in program_lines(text))
+    return text.encode("utf-8") if isinstance(text, unicode) else text
+
+def source_hash(kind, text):
+    digest = hashlib.sha1("%s:%d:%d\n" % (kind, ASSEMBLER_VERSION, PROGRAM_VERSION))
+    digest.update(normalized(text))
+    return digest.hexdigest()
+
+
+def result_key(text, **config):
+    """Key of the simulation of bytecode `text` with every option in `config`."""
+    digest = hashlib.sha1("%d:%s\n" % (RESULTS_VERSION, source_hash("bytecode", text)))
+    digest.update(repr(sorted(config.items())))
+    return digest.hexdigest()
+
+
+class ProgramCache(object):
+    """
+    Content-addressed cache directory of assembled programs, one packed
+    `Program` and its `pack_decoded` table per file named by `source_hash`,
+    so a hit decodes nothing. Files
+    are written to a temporary name and renamed into place, so readers never
+    see a partial entry, and the least recently used ones are removed once
+    the directory grows over `max_bytes`. The total size is tracked as
+    entries are written, so the directory is only listed at startup and when
+    evicting. The directory must be private to the current user; ValueError
+    is raised otherwise.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(directory, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        info = os.lstat(directory)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0077:
+            raise ValueError("%s is not a private directory" % directory)
+        self._lock = threading.Lock()
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Decoded `Program` stored under `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            size, = ENTRY.unpack_from(data, 0)
+            program = Program.from_buffer(data[ENTRY.size:ENTRY.size + size])
+            program.load_decoded(data[ENTRY.size + size:])
+        except IOError:
+            return None
+        except Exception:
+            # truncated or written by an incompatible version
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return program
+
+    def set(self, key, program):
+        fd, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            packed = program.to_bytes()
+            decoded = program.pack_decoded()
+            with os.fdopen(fd, "wb") as f:
+                f.write(ENTRY.pack(len(packed)))
+                f.write(packed)
+                f.write(decoded)
+            size = ENTRY.size + len(packed) + len(decoded)
+            path = self._path(key)
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.rename(temporary, path)
+        except Exception:
+            self._remove(temporary)
+            raise
+        with self._lock:
+            self.size += size - replaced
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        return entries
+
+    def _evict(self):
+        # other processes may share the directory, so the size is rescanned
+        # and the least recently used entries removed down to the low water
+        # mark, leaving room for a batch of writes before the next scan
+        entries = self._entries()
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * LOW_WATER:
+                break
+            self._remove(path)
+            total -= size
+        self.size = total
+
+    def assemble(self, source):
+        """Assembled and decoded `Program` of assembly `source`."""
+        key = source_hash("assembly", source)
+        program = self.get(key)
+        if program is None:
+            interpreter = Interpreter(source)
+            interpreter.compile()
+            program = interpreter.program()
+            program.decode()
+            self.set(key, program)
+        return program
+
+    def load(self, text):
+        """Decoded `Program` of bytecode `text`, ready to give to `Mips`."""
+        key = source_hash("bytecode", text)
+        program = self.get(key)
+        if program is None:
+            program = Program.from_lines(program_lines(text))
+            program.decode()
+            self.set(key, program)
+        return program
+
+
+class ResultCache(object):
+    """
+    LRU of serialized simulation results keyed by `result_key`, bounded by
+    the total size of the values. With a `filename` the entries are also
+    kept in a sqlite database, under the same budget, so they survive
+    restarts.
+    """
+
+    def __init__(self, max_bytes=RESULTS_MAX_BYTES, filename=None, clock=time.time):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._clock = clock
+        self.filename = filename
+        self._db = None
+        self._touched = {}
+
+    def _database(self):
+        # opened on first use, so processes forked before do not inherit it
+        if self._db is None and self.filename is not None:
+            self._db = sqlite3.connect(self.filename, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, value BLOB, accessed REAL)")
+            self._db.commit()
+        return self._db
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._results.pop(key)
+            except KeyError:
+                value = self._load(key)
+                if value is None:
+                    return None
+                self.size += len(value)
+            else:
+                self._touch(key)
+            self._results[key] = value
+            self._evict()
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._results:
+                self.size -= len(self._results.pop(key))
+            self._results[key] = value
+            self.size += len(value)
+            self._evict()
+            self._store(key, value)
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, value = self._results.popitem(last=False)
+            self.size -= len(value)
+
+    def _touch(self, key):
+        # keeps hot keys from looking cold to the database eviction
+        if self.filename is None:
+            return
+        self._touched[key] = self._clock()
+        if len(self._touched) >= TOUCH_BATCH:
+            self._write_touched()
+            self._db.commit()
+
+    def _write_touched(self):
+        if self._touched and self._database() is not None:
+            self._db.executemany("UPDATE results SET accessed = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in self._touched.items()])
+        self._touched = {}
+
+    def _load(self, key):
+        if self._database() is None:
+            return None
+        row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (self._clock(), key))
+        self._db.commit()
+        return str(row[0])
+
+    def _store(self, key, value):
+        if self._database() is None:
+            return
+        self._write_touched()
+        self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                         (key, sqlite3.Binary(value), self._clock()))
+        total = self._db.execute("SELECT TOTAL(LENGTH(value)) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            for old_key, size in self._db.execute("SELECT key, LENGTH(value) FROM results "
+                                                  "ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                total -= size
+        self._db.commit()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key):
+        return key in self._results
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._write_touched()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+            self.filename = None
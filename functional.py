@@ -0,0 +1,161 @@
+from instructions import (AddInstruction, AddiInstruction,
+                          BeqInstruction, BleInstruction, BneInstruction,
+                          JmpInstruction, LwInstruction, MulInstruction,
+                          NopInstruction, SubInstruction, SwInstruction)
+from mips import load_program, REGISTERS_SIZE, MEMORY_SIZE
+from registers import Registers
+from memory import Memory
+from word import to_word
+
+
+def _add(fields, pc):
+    rd, rs, rt, next_pc = fields["rd"], fields["rs"], fields["rt"], pc + 4
+    def op(registers, memory):
+        try:
+            registers[rd] = registers[rs] + registers[rt]
+        except OverflowError:
+            registers[rd] = to_word(registers[rs] + registers[rt])
+        return next_pc
+    return op
+
+def _addi(fields, pc):
+    rt, rs, immediate, next_pc = fields["rt"], fields["rs"], fields["immediate"], pc + 4
+    def op(registers, memory):
+        try:
+            registers[rt] = registers[rs] + immediate
+        except OverflowError:
+            registers[rt] = to_word(registers[rs] + immediate)
+        return next_pc
+    return op
+
+def _sub(fields, pc):
+    rd, rs, rt, next_pc = fields["rd"], fields["rs"], fields["rt"], pc + 4
+    def op(registers, memory):
+        try:
+            registers[rd] = registers[rs] - registers[rt]
+        except OverflowError:
+            registers[rd] = to_word(registers[rs] - registers[rt])
+        return next_pc
+    return op
+
+def _mul(fields, pc):
+    rd, rs, rt, next_pc = fields["rd"], fields["rs"], fields["rt"], pc + 4
+    def op(registers, memory):
+        try:
+            registers[rd] = registers[rs] * registers[rt]
+        except OverflowError:
+            registers[rd] = to_word(registers[rs] * registers[rt])
+        return next_pc
+    return op
+
+def _lw(fields, pc):
+    rt, rs, immediate, next_pc = fields["rt"], fields["rs"], fields["immediate"], pc + 4
+    def op(registers, memory):
+        registers[rt] = memory[registers[rs] + immediate]
+        return next_pc
+    return op
+
+def _sw(fields, pc):
+    rt, rs, immediate, next_pc = fields["rt"], fields["rs"], fields["immediate"], pc + 4
+    def op(registers, memory):
+        memory[registers[rs] + immediate] = registers[rt]
+        return next_pc
+    return op
+
+def _beq(fields, pc):
+    rs, rt, target, next_pc = fields["rs"], fields["rt"], pc + fields["immediate"], pc + 4
+    def op(registers, memory):
+        return target if registers[rs] == registers[rt] else next_pc
+    return op
+
+def _ble(fields, pc):
+    rs, rt, target, next_pc = fields["rs"], fields["rt"], fields["immediate"], pc + 4
+    def op(registers, memory):
+        return target if registers[rs] <= registers[rt] else next_pc
+    return op
+
+def _bne(fields, pc):
+    rs, rt, target, next_pc = fields["rs"], fields["rt"], pc + fields["immediate"] + 4, pc + 4
+    def op(registers, memory):
+        return target if registers[rs] != registers[rt] else next_pc
+    return op
+
+def _jmp(fields, pc):
+    target = fields["target_address"]
+    def op(registers, memory):
+        return target
+    return op
+
+def _nop(fields, pc):
+    next_pc = pc + 4
+    def op(registers, memory):
+        return next_pc
+    return op
+
+map_compiler = {AddInstruction:_add,
+                AddiInstruction:_addi,
+                BeqInstruction:_beq,
+                BleInstruction:_ble,
+                BneInstruction:_bne,
+                JmpInstruction:_jmp,
+                LwInstruction:_lw,
+                MulInstruction:_mul,
+                NopInstruction:_nop,
+                SubInstruction:_sub,
+                SwInstruction:_sw}
+
+
+def compile_program(decoded_instructions):
+    """
+    Compile decoded instructions into closures `op(registers, memory)` that
+    execute the instruction and return the next pc. Register numbers,
+    immediates and branch targets are bound when compiling. Arithmetic wraps to
+    32 bits like `Registers`; the wrap only costs anything when the word
+    array rejects an out of range result.
+    """
+    return [map_compiler[template.instruction_class](dict(template.fields), 4 * n)
+            for n, template in enumerate(decoded_instructions)]
+
+
+class FunctionalMips(object):
+    """
+    ISA-level executor. Runs the same decoded program as `Mips` on the same
+    `Registers` and `Memory`, with one dispatch per instruction and no
+    pipeline, so only the architectural result is modelled.
+    """
+
+    def __init__(self, instructions=None, memory=None):
+        self.instructions, self.decoded_instructions = load_program(instructions)
+        self.ops = compile_program(self.decoded_instructions)
+
+        self.registers = Registers(size=REGISTERS_SIZE)
+        self.memory = memory if memory is not None else Memory(size=MEMORY_SIZE)
+
+        self.pc = 0
+        self.instructions_completed = 0
+
+    def run(self, max_instructions=None):
+        """
+        Execute until the pc leaves the program or `max_instructions` have
+        completed. Returns the number of instructions completed.
+        """
+        ops = self.ops
+        registers = self.registers._array
+        memory = self.memory
+        end = 4 * len(ops)
+        pc = self.pc
+        completed = self.instructions_completed
+
+        if max_instructions is None:
+            while 0 <= pc < end:
+                pc = ops[pc >> 2](registers, memory)
+                completed += 1
+        else:
+            limit = completed + max_instructions
+            while 0 <= pc < end and completed < limit:
+                pc = ops[pc >> 2](registers, memory)
+                completed += 1
+
+        self.pc = pc
+        self.instructions_completed = completed
+        return completed
@@ -0,0 +1,116 @@
+from __future__ import division
+
+from copy import deepcopy
+
+SCALARS = ("clock", "pc", "instructions_completed")
+MEMORY_WINDOW = 4
+
+
+class DeltaHistory(object):
+    """
+    Execution history that keeps one full keyframe and, for every following
+    cycle, only what changed: scalars, registers, pipeline slots and the new
+    memory events. Pipeline slots are stored as indexes into `phases`, a table
+    of the distinct instruction states seen, and throughput is derived from
+    the other counters. Indexing and iterating rebuild full
+    `Mips.current_state()` dicts.
+    """
+
+    def __init__(self):
+        self.keyframe = None
+        self.deltas = []
+        self.phases = []
+        self._phase_index = {}
+        self._last = None
+
+    def append(self, state):
+        if self.keyframe is None:
+            self.keyframe = deepcopy(state)
+        else:
+            self.deltas.append(self._delta(self._last, state))
+        self._last = state
+
+    def _delta(self, previous, state):
+        delta = {}
+        for key in SCALARS:
+            if state[key] != previous[key]:
+                delta[key] = state[key]
+
+        registers = dict((i, value) for i, (old, value) in
+                         enumerate(zip(previous["registers"], state["registers"]))
+                         if old != value)
+        if registers:
+            delta["registers"] = registers
+
+        pipeline = dict((i, self._phase(phase)) for i, (old, phase) in
+                        enumerate(zip(previous["pipeline"], state["pipeline"]))
+                        if old != phase)
+        if pipeline:
+            delta["pipeline"] = pipeline
+
+        events = self._memory_events(previous["memory"], state["memory"])
+        if events:
+            delta["memory"] = events
+        return delta
+
+    def _phase(self, phase):
+        key = (phase["text"], tuple(sorted(phase["flags"].items())))
+        try:
+            return self._phase_index[key]
+        except KeyError:
+            self.phases.append(phase)
+            self._phase_index[key] = len(self.phases) - 1
+            return self._phase_index[key]
+
+    def _memory_events(self, previous, memory):
+        """
+        Smallest tail of `memory` that, appended to `previous`, yields the
+        `memory` window again.
+        """
+        for n in range(len(memory) + 1):
+            new = memory[len(memory) - n:]
+            if (previous + new)[-MEMORY_WINDOW:] == memory:
+                return new
+        return memory
+
+    def _apply(self, state, delta):
+        for key in SCALARS:
+            if key in delta:
+                state[key] = delta[key]
+        for i, value in delta.get("registers", {}).items():
+            state["registers"][i] = value
+        for i, phase in delta.get("pipeline", {}).items():
+            state["pipeline"][i] = deepcopy(self.phases[phase])
+        if "memory" in delta:
+            state["memory"] = (state["memory"] + delta["memory"])[-MEMORY_WINDOW:]
+        clock = state["clock"]
+        state["throughput"] = state["instructions_completed"] / clock if clock > 0 else 0
+
+    def state_at(self, cycle):
+        if cycle < 0:
+            cycle += len(self)
+        if not 0 <= cycle < len(self):
+            raise IndexError(cycle)
+
+        state = deepcopy(self.keyframe)
+        for delta in self.deltas[:cycle]:
+            self._apply(state, delta)
+        return state
+
+    def serialize(self):
+        return {"keyframe":self.keyframe, "deltas":self.deltas, "phases":self.phases}
+
+    def __len__(self):
+        return 0 if self.keyframe is None else len(self.deltas) + 1
+
+    def __getitem__(self, cycle):
+        return self.state_at(cycle)
+
+    def __iter__(self):
+        if self.keyframe is None:
+            return
+        state = deepcopy(self.keyframe)
+        yield deepcopy(state)
+        for delta in self.deltas:
+            self._apply(state, delta)
+            yield deepcopy(state)
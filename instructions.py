@@ -1,7 +1,7 @@
 import logging
+from collections import namedtuple
 from copy import copy
 
-from registers import RegisterInUseException
 
 ALU_SRC = "ALU_SRC"
 REG_DST = "REG_DST"
@@ -12,71 +12,101 @@ BRANCH = "BRANCH"
 JUMP = "JUMP"
 EXT_OP = "EXT_OP"
 
+MUL_LATENCY = 2 # cycles in execute
+
+class InstructionTemplate(namedtuple("InstructionTemplate", "instruction_class fields")):
+    """
+    Immutable result of decoding one program line. Calling it creates a fresh
+    instruction instance without parsing the bytecode again.
+    """
+    __slots__ = ()
+
+    def __call__(self):
+        instruction = self.instruction_class()
+        for name, value in self.fields:
+            setattr(instruction, name, value)
+        return instruction
+
+
 class Instruction(object):
     """Factory"""
     
     class R(object):
-        def __new__(cls, bytecode, text):
+        @staticmethod
+        def decode(bytecode, text):
             try:
                 funct = bytecode[26:32]
-                instruction = map_r_instruction_funct[funct]()
+                instruction_class = map_r_instruction_funct[funct]
             except KeyError:
                 logging.info("Invalid funct to R instruction: '%s ; %s'.", 
                               bytecode, text)
                 raise
                 
-            instruction.bytecode = bytecode
-            instruction.opcode = bytecode[0:6]
-            instruction.rs = int(bytecode[6:11], 2)
-            instruction.rt = int(bytecode[11:16], 2)
-            instruction.rd = int(bytecode[16:21], 2)
-            instruction.shamt = bytecode[21:26]
-            instruction.funct = bytecode[26:32]
-            instruction.text = text
-            return instruction
+            fields = (("bytecode", bytecode),
+                      ("opcode", bytecode[0:6]),
+                      ("rs", int(bytecode[6:11], 2)),
+                      ("rt", int(bytecode[11:16], 2)),
+                      ("rd", int(bytecode[16:21], 2)),
+                      ("shamt", bytecode[21:26]),
+                      ("funct", bytecode[26:32]),
+                      ("text", text))
+            return InstructionTemplate(instruction_class, fields)
+
+        def __new__(cls, bytecode, text):
+            return cls.decode(bytecode, text)()
             
         
     class I(object):
-        def __new__(cls, bytecode, text):
+        @staticmethod
+        def decode(bytecode, text):
             try:
                 opcode = bytecode[0:6]
-                instruction = map_i_instruction[opcode]()
+                instruction_class = map_i_instruction[opcode]
             except KeyError:
                 logging.info("Invalid opcode to I instruction: '%s ; %s'.", 
                               bytecode, text)
                 raise
 
-            instruction.bytecode = bytecode
-            instruction.opcode = bytecode[0:6]
-            instruction.rs = int(bytecode[6:11], 2)
-            instruction.rt = int(bytecode[11:16], 2)
-            instruction.immediate = int(bytecode[16:32], 2)
-            
+            immediate = int(bytecode[16:32], 2)
             if bytecode[16] == '1': # immediate is a two complement number
-                instruction.immediate -= (1 << 16)
+                immediate -= (1 << 16)
                 
-            instruction.text = text
-            return instruction
+            fields = (("bytecode", bytecode),
+                      ("opcode", bytecode[0:6]),
+                      ("rs", int(bytecode[6:11], 2)),
+                      ("rt", int(bytecode[11:16], 2)),
+                      ("immediate", immediate),
+                      ("text", text))
+            return InstructionTemplate(instruction_class, fields)
+
+        def __new__(cls, bytecode, text):
+            return cls.decode(bytecode, text)()
             
         
     class J(object):
-        def __new__(cls, bytecode, text):
+        @staticmethod
+        def decode(bytecode, text):
             try:
                 opcode = bytecode[0:6]
-                instruction = map_j_instruction[opcode]()
+                instruction_class = map_j_instruction[opcode]
             except KeyError:
                 logging.info("Invalid opcode to J instruction: '%s ; %s'.", 
                               bytecode, text)
                 raise
                 
-            instruction.bytecode = bytecode
-            instruction.opcode = bytecode[0:6]
-            instruction.target_address = int(bytecode[6:32], 2)
-            instruction.text = text
-            return instruction
+            fields = (("bytecode", bytecode),
+                      ("opcode", bytecode[0:6]),
+                      ("target_address", int(bytecode[6:32], 2)),
+                      ("text", text))
+            return InstructionTemplate(instruction_class, fields)
+
+        def __new__(cls, bytecode, text):
+            return cls.decode(bytecode, text)()
             
-        
-    def __new__(cls, line):
+    
+    @staticmethod
+    def decode(line):
+        """Decode `line` once into an `InstructionTemplate`."""
         try:
             bytecode, text = line.split(";")
         except ValueError:
@@ -89,26 +119,40 @@ class Instruction(object):
         opcode = bytecode[0:6]
         try:
             instruction_type = map_opcode_type[opcode]
-            return instruction_type(bytecode, text)
-            
         except KeyError:
             logging.info("Invalid opcode to instruction: '%s'.", line)
             raise
 
+        return instruction_type.decode(bytecode, text)
+
+    def __new__(cls, line):
+        return cls.decode(line)()
+
+
+def instruction_flags(**kwargs):
+    """Control flags of an instruction class, shared by all its instances."""
+    return {REG_DST:kwargs.get(REG_DST, 0),
+            ALU_SRC:kwargs.get(ALU_SRC, 0),
+            MEM_TO_REG:kwargs.get(MEM_TO_REG, 0),
+            REG_WRITE:kwargs.get(REG_WRITE, 0),
+            MEM_WRITE:kwargs.get(MEM_WRITE, 0),
+            BRANCH:kwargs.get(BRANCH, 0),
+            JUMP:kwargs.get(JUMP, 0),
+            EXT_OP:kwargs.get(EXT_OP, 0)}
+
 
 class BaseInstruction(object):
-    def __init__(self, **kwargs):
-        self.flags = {REG_DST:kwargs.get(REG_DST, 0),
-                      ALU_SRC:kwargs.get(ALU_SRC, 0),
-                      MEM_TO_REG:kwargs.get(MEM_TO_REG, 0),
-                      REG_WRITE:kwargs.get(REG_WRITE, 0),
-                      MEM_WRITE:kwargs.get(MEM_WRITE, 0),
-                      BRANCH:kwargs.get(BRANCH, 0),
-                      JUMP:kwargs.get(JUMP, 0),
-                      EXT_OP:kwargs.get(EXT_OP, 0)}
-                      
-        self.execution_time = kwargs.get("execution_time", 1)
-        self._to_lock = kwargs.get("to_lock", [])
+    __slots__ = ("bytecode", "opcode", "rs", "rt", "rd", "shamt", "funct",
+                 "immediate", "target_address", "text", "pc",
+                 "rs_value", "rt_value", "rd_value", "memory_address",
+                 "execution_time", "_to_lock", "_locked")
+
+    flags = instruction_flags()
+
+    def __init__(self, execution_time=1):
+        self.execution_time = execution_time
+        self._to_lock = ()
+        self._locked = False
         
     def instruction_decode(self, mips=None):
         self.lock_registers(mips)
@@ -126,12 +170,16 @@ class BaseInstruction(object):
         return True
         
     def lock_registers(self, mips):
-        for register in self._to_lock:
-            mips.registers.lock(register)
+        if not self._locked:
+            for register in self._to_lock:
+                mips.registers.lock(register, self)
+            self._locked = True
 
     def unlock_registers(self, mips):
-        for register in self._to_lock:
-            mips.registers.unlock(register)
+        if self._locked:
+            for register in self._to_lock:
+                mips.registers.unlock(register)
+            self._locked = False
                 
     def current_state(self):
         state = {"text":self.text,
@@ -140,72 +188,74 @@ class BaseInstruction(object):
         
     
 class AddInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=1, REG_WRITE=1, EXT_OP=None)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=1, REG_WRITE=1, EXT_OP=None)
         
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            self._to_lock.append(self.rd)
-            BaseInstruction.instruction_decode(self, mips)
+        registers = mips.registers
+        if self._locked:
             return True
-        except RegisterInUseException:
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        self._to_lock = (self.rd,)
+        return BaseInstruction.instruction_decode(self, mips)
         
     def execute(self, mips):
         BaseInstruction.execute(self)
         self.rd_value = self.rs_value + self.rt_value
         if mips.data_forwarding:
-            mips.registers[self.rd] = self.rd_value
+            mips.registers.forward(self.rd, self.rd_value, self)
         return self.execution_time == 0
         
     def write_back(self, mips):
+        mips.registers.commit(self.rd, self.rd_value)
         BaseInstruction.write_back(self, mips)
-        mips.registers[self.rd] = self.rd_value
         return True
 
 
 class AddiInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=1, REG_WRITE=1, EXT_OP=0, ALU_SRC=1)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=1, REG_WRITE=1, EXT_OP=0, ALU_SRC=1)
             
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self._to_lock.append(self.rt)
-            BaseInstruction.instruction_decode(self, mips)
+        registers = mips.registers
+        if self._locked:
             return True
-        except RegisterInUseException:
+        if not registers.ready(self.rs):
             return False
+        self.rs_value = registers[self.rs]
+        self._to_lock = (self.rt,)
+        return BaseInstruction.instruction_decode(self, mips)
 
     def execute(self, mips):
         BaseInstruction.execute(self)
         self.rt_value = self.rs_value + self.immediate
         if mips.data_forwarding:
-            mips.registers[self.rt] = self.rt_value
+            mips.registers.forward(self.rt, self.rt_value, self)
         return self.execution_time == 0
         
     def write_back(self, mips):
+        mips.registers.commit(self.rt, self.rt_value)
         BaseInstruction.write_back(self, mips)
-        mips.registers[self.rt] = self.rt_value
         return True
         
         
 class BeqInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=None, MEM_TO_REG=None, BRANCH=1, EXT_OP=None)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=None, MEM_TO_REG=None, BRANCH=1, EXT_OP=None)
             
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            return True
-        except RegisterInUseException:
+        registers = mips.registers
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        return True
         
     def execute(self, mips):
         BaseInstruction.execute(self)
@@ -216,17 +266,17 @@ class BeqInstruction(BaseInstruction):
         
         
 class BleInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=None, ALU_SRC=1, MEM_TO_REG=None, BRANCH=1, EXT_OP=None)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=None, ALU_SRC=1, MEM_TO_REG=None, BRANCH=1, EXT_OP=None)
                 
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            return True
-        except RegisterInUseException:
+        registers = mips.registers
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        return True
         
     def execute(self, mips):
         BaseInstruction.execute(self)
@@ -237,17 +287,17 @@ class BleInstruction(BaseInstruction):
         
 
 class BneInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=None, MEM_TO_REG=None, BRANCH=1, EXT_OP=None)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=None, MEM_TO_REG=None, BRANCH=1, EXT_OP=None)
                 
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            return True
-        except RegisterInUseException:
+        registers = mips.registers
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        return True
         
     def execute(self, mips):
         BaseInstruction.execute(self)
@@ -258,9 +308,9 @@ class BneInstruction(BaseInstruction):
         
     
 class JmpInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=None, ALU_SRC=None, MEM_TO_REG=None, JUMP=1, EXT_OP=None)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=None, ALU_SRC=None, MEM_TO_REG=None, JUMP=1, EXT_OP=None)
                  
     def instruction_decode(self, mips):
         self.pc = self.target_address
@@ -273,18 +323,19 @@ class JmpInstruction(BaseInstruction):
         
     
 class LwInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            ALU_SRC=1, MEM_TO_REG=1, REG_WRITE=1, EXT_OP=1)
+    __slots__ = ()
+
+    flags = instruction_flags(ALU_SRC=1, MEM_TO_REG=1, REG_WRITE=1, EXT_OP=1)
                                            
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self._to_lock.append(self.rt)
-            BaseInstruction.instruction_decode(self, mips)
+        registers = mips.registers
+        if self._locked:
             return True
-        except RegisterInUseException:
+        if not registers.ready(self.rs):
             return False
+        self.rs_value = registers[self.rs]
+        self._to_lock = (self.rt,)
+        return BaseInstruction.instruction_decode(self, mips)
                  
     def execute(self, mips):
         BaseInstruction.execute(self)
@@ -296,91 +347,110 @@ class LwInstruction(BaseInstruction):
         return True
                 
     def write_back(self, mips):
+        mips.registers.commit(self.rt, self.rt_value)
         BaseInstruction.write_back(self, mips)
-        mips.registers[self.rt] = self.rt_value
         return True
         
 
 class MulInstruction(BaseInstruction):
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=1, REG_WRITE=1, EXT_OP=None)
+
     def __init__(self):
-        BaseInstruction.__init__(self, execution_time=2,
-            REG_DST=1, REG_WRITE=1, EXT_OP=None)
+        BaseInstruction.__init__(self, execution_time=MUL_LATENCY)
                                   
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            self._to_lock.append(self.rd)
-            BaseInstruction.instruction_decode(self, mips)
+        registers = mips.registers
+        if self._locked:
             return True
-        except RegisterInUseException:
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        self._to_lock = (self.rd,)
+        return BaseInstruction.instruction_decode(self, mips)
         
     def execute(self, mips):
         if BaseInstruction.execute(self):
             self.rd_value = self.rs_value * self.rt_value
             if mips.data_forwarding:
-                mips.registers[self.rd] = self.rd_value
+                mips.registers.forward(self.rd, self.rd_value, self)
             return True
         return False
         
     def write_back(self, mips):
-        mips.registers.unlock(self.rd)
-        mips.registers[self.rd] = self.rd_value
+        mips.registers.commit(self.rd, self.rd_value)
+        self.unlock_registers(mips)
         return True
         
 
 class NopInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self)
+    __slots__ = ()
         
     
 class StallInstruction(NopInstruction):
+    """
+    Bubble in the pipeline. It keeps no per-flight state, so the single
+    `STALL` instance is shared by every empty stage.
+    """
+    __slots__ = ()
+
     def __init__(self):
         NopInstruction.__init__(self)
         self.text = "stall"
+
+    def execute(self, mips=None):
+        return True
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
         
     
 class SubInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_WRITE=1, EXT_OP=None)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_WRITE=1, EXT_OP=None)
         
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            self._to_lock.append(self.rd)
-            BaseInstruction.instruction_decode(self, mips)
+        registers = mips.registers
+        if self._locked:
             return True
-        except RegisterInUseException:
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        self._to_lock = (self.rd,)
+        return BaseInstruction.instruction_decode(self, mips)
         
     def execute(self, mips):
         BaseInstruction.execute(self)
         self.rd_value = self.rs_value - self.rt_value
         if mips.data_forwarding:
-            mips.registers[self.rd] = self.rd_value
+            mips.registers.forward(self.rd, self.rd_value, self)
         return self.execution_time == 0
 
     def write_back(self, mips):
+        mips.registers.commit(self.rd, self.rd_value)
         BaseInstruction.write_back(self, mips)
-        mips.registers[self.rd] = self.rd_value
         return True
         
 
 class SwInstruction(BaseInstruction):
-    def __init__(self):
-        BaseInstruction.__init__(self,
-            REG_DST=None, ALU_SRC=1, MEM_TO_REG=None, MEM_WRITE=1, EXT_OP=1)
+    __slots__ = ()
+
+    flags = instruction_flags(REG_DST=None, ALU_SRC=1, MEM_TO_REG=None, MEM_WRITE=1, EXT_OP=1)
                                            
     def instruction_decode(self, mips):
-        try:
-            self.rs_value = mips.registers[self.rs]
-            self.rt_value = mips.registers[self.rt]
-            return True
-        except RegisterInUseException:
+        registers = mips.registers
+        if not (registers.ready(self.rs) and registers.ready(self.rt)):
             return False
+        self.rs_value = registers[self.rs]
+        self.rt_value = registers[self.rt]
+        return True
 
     def execute(self, mips):
         BaseInstruction.execute(self)
@@ -392,6 +462,8 @@ class SwInstruction(BaseInstruction):
         return True
         
         
+STALL = StallInstruction()
+
 map_opcode_type = {"000000":Instruction.R,
                    "000010":Instruction.J,
                    "000100":Instruction.I,
@@ -2,6 +2,11 @@
 
 import re
 
+from program import Program, ProgramWriter
+
+# bump when the encoding changes, to invalidate cached programs
+ASSEMBLER_VERSION = 1
+
 ADD = "add"
 ADDI = "addi"
 BEQ = "beq"
@@ -37,22 +42,26 @@ map_re = {NOP:RE_NOP,
           MUL:RE_WITH_REGISTER,
           SUB:RE_WITH_REGISTER}
 
-map_opcode = {ADD:"000000",
-              ADDI:"001000",
-              BEQ:"000101",
-              BLE:"000111",
-              BNE:"000100",
-              JMP:"000010",
-              LW:"100011",
-              MUL:"000000",
-              NOP:"000000",
-              SUB:"000000",
-              SW:"101011"}
+map_opcode = {ADD:0b000000,
+              ADDI:0b001000,
+              BEQ:0b000101,
+              BLE:0b000111,
+              BNE:0b000100,
+              JMP:0b000010,
+              LW:0b100011,
+              MUL:0b000000,
+              NOP:0b000000,
+              SUB:0b000000,
+              SW:0b101011}
               
-map_funct = {ADD:"100000",
-             MUL:"011000",
-             NOP:"000000",
-             SUB:"100010"}
+map_funct = {ADD:0b100000,
+             MUL:0b011000,
+             NOP:0b000000,
+             SUB:0b100010}
+
+REGISTER_MASK = (1 << 5) - 1
+IMMEDIATE_MASK = (1 << 16) - 1
+TARGET_MASK = (1 << 26) - 1
 
 
 class Interpreter(object):
@@ -60,7 +69,8 @@ class Interpreter(object):
     def __init__(self, text=None):
         splitted_text = text.split("\n") if text else []
         self.text_instructions = [t.strip() for t in splitted_text if t.strip()]
-        self.instructions = []
+        self.words = []
+        self.texts = []
         self.labels = {}
         
     def _parse_line(self, line):
@@ -88,86 +98,55 @@ class Interpreter(object):
         raise Exception(line)
         
     def _compile_line(self, tokens, pc):
+        """Encode one parsed instruction as a `(word, text)` pair."""
         instruction = tokens["instruction"]
-        
-        if instruction in _instructions:
-            opcode = map_opcode[instruction]
-        
-            if instruction in  NOP:
-                bytecode = self._to_bin(0, 32)
-                text = "%s" % instruction
-            if instruction == JMP:
-                label_position = self.labels[tokens.get("label")]
-                target_address = self._to_bin(label_position, 26)
-                bytecode = "%s%s" % (opcode, target_address)
-                text = "%s %s" % (instruction, label_position)
-            if instruction in (ADDI, LW, SW, BEQ, BLE, BNE):
-                rs = tokens.get("rs")
-                rs_bin = self._register_to_bin(rs)
-                rt = tokens.get("rt")
-                rt_bin = self._register_to_bin(rt)
-
-                if instruction in (BEQ, BNE):
-                    label_position = self.labels[tokens.get("label")]
-                    immediate = label_position - pc + 4
-                elif instruction == BLE:
-                    label_position = self.labels[tokens.get("label")]
-                    immediate = label_position
-                else:
-                    immediate = tokens.get("immediate")
-                    
-                immediate_bin = self._to_bin(immediate, 16)
-                    
-                if instruction in (LW, SW):
-                    text = "%s %s,%s(%s)" % (instruction, rt, immediate, rs)
-                elif instruction in (ADDI):
-                    text = "%s %s,%s,%s" % (instruction, rt, rs, immediate)
-                else:
-                    text = "%s %s,%s,%s" % (instruction, rs, rt, immediate)
-                    
-                bytecode = "%s%s%s%s" % (opcode, rs_bin, rt_bin, immediate_bin)
-
-            if instruction in (ADD, MUL, SUB):
-                rs = tokens.get("rs")
-                rs_bin = self._register_to_bin(rs)
-                rt = tokens.get("rt")
-                rt_bin = self._register_to_bin(rt)
-                rd = tokens.get("rd")
-                rd_bin = self._register_to_bin(rd)
-                shamt = "00000"
-                funct = map_funct[instruction]
-                bytecode = "%s%s%s%s%s%s" % (opcode, rs_bin, rt_bin, rd_bin, shamt, funct)
-                text = "%s %s,%s,%s" % (instruction, rd, rs, rt)
-                
-            return "%s ; I%d: %s" % (bytecode, len(self.instructions) + 1, text)
+        opcode = map_opcode[instruction] << 26
+
+        if instruction == NOP:
+            return 0, instruction
+
+        if instruction == JMP:
+            label_position = self.labels[tokens["label"]]
+            word = opcode | (label_position & TARGET_MASK)
+            return word, "%s %s" % (instruction, label_position)
+
+        rs = tokens["rs"]
+        rt = tokens["rt"]
+        registers = opcode | self._register(rs) << 21 | self._register(rt) << 16
+
+        if instruction in (ADD, MUL, SUB):
+            rd = tokens["rd"]
+            word = registers | self._register(rd) << 11 | map_funct[instruction]
+            return word, "%s %s,%s,%s" % (instruction, rd, rs, rt)
+
+        if instruction in (BEQ, BNE):
+            immediate = self.labels[tokens["label"]] - pc + 4
+        elif instruction == BLE:
+            immediate = self.labels[tokens["label"]]
+        else:
+            immediate = tokens["immediate"]
+        word = registers | (int(immediate) & IMMEDIATE_MASK)
+
+        if instruction in (LW, SW):
+            text = "%s %s,%s(%s)" % (instruction, rt, immediate, rs)
+        elif instruction == ADDI:
+            text = "%s %s,%s,%s" % (instruction, rt, rs, immediate)
+        else:
+            text = "%s %s,%s,%s" % (instruction, rs, rt, immediate)
+        return word, text
+
+    def _register(self, register):
+        return int(register[1:]) & REGISTER_MASK
 
-    def _register_to_bin(self, register):
-        return self._to_bin(int(register.strip("R")), 5) 
-        
     def _to_bin(self, number, length=0):
         """
         Convert `number` to binary, appending zeros to left to return a string with length.
         If `number` is negative, two complement is used.
         """
         n = int(number)
-        if n >= 0:
-            binary = bin(abs(n))[2:]
-            zeros = "0" * length
-        else:
-            t = ['0' if c == '1' else '1' for c in bin(abs(n))[2:]]
-            
-            for i in reversed(xrange(len(t))):
-                if t[i] == '0':
-                    t[i] = '1'
-                    break
-                elif t[i] == '1':
-                    t[i] = '0'
-                    
-            t.insert(0, '1')
-            binary = "".join(t)
-            zeros = "1" * length
-            
-        return ("%s%s" % (zeros, binary))[-length:]
+        if not length:
+            length = len(bin(abs(n))) - 2 + (n < 0)
+        return format(n & ((1 << length) - 1), "0%db" % length)
         
     def parse(self):
         result = []
@@ -185,13 +164,67 @@ class Interpreter(object):
         
     def compile(self):
         parsed_instructions = self.parse()
-        self.instructions = []
+        self.words = []
+        self.texts = []
         pc = 0
                 
         for instruction in parsed_instructions:
             pc += 4
-            self.instructions.append(self._compile_line(instruction, pc))
-            
+            word, text = self._compile_line(instruction, pc)
+            self.words.append(word)
+            self.texts.append(text)
+
+    def assemble(self, lines, output, texts=True):
+        """
+        Single pass over `lines`, any iterable of source lines such as an
+        open file. Each instruction is encoded as soon as it is read and
+        written to `output`, a seekable binary file, as a packed program.
+        Forward label references are written as placeholders and patched
+        when the label appears, so only unresolved references (and the
+        labels seen) are kept. Returns the number of instructions.
+        """
+        writer = ProgramWriter(output, texts)
+        unresolved = {}
+        pc = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            tokens = self._parse_line(line)
+            if tokens["instruction"] == LABEL:
+                label = tokens["label"]
+                self.labels[label] = pc
+                for index, reference, reference_pc in unresolved.pop(label, ()):
+                    word, text = self._compile_line(reference, reference_pc)
+                    writer.patch(index, word, "I%d: %s" % (index + 1, text))
+                continue
+
+            tokens["instruction"] = tokens["instruction"].lower()
+            pc += 4
+            label = tokens.get("label")
+            if label is not None and label not in self.labels:
+                unresolved.setdefault(label, []).append((writer.count, tokens, pc))
+                writer.append(0)
+            else:
+                word, text = self._compile_line(tokens, pc)
+                writer.append(word, "I%d: %s" % (writer.count + 1, text))
+
+        if unresolved:
+            raise KeyError(min(unresolved))
+        writer.close(self.labels)
+        return writer.count
+
+    @property
+    def instructions(self):
+        """Compiled instructions as "bytecode ; In: text" lines."""
+        return ["%s ; I%d: %s" % (format(word, "032b"), i, text)
+                for i, (word, text) in enumerate(zip(self.words, self.texts), 1)]
+
+    def program(self):
+        """Compiled instructions as a packed binary `Program`."""
+        texts = ["I%d: %s" % (i, text) for i, text in enumerate(self.texts, 1)]
+        return Program(self.words, texts, self.labels)
+
     def __str__(self):
         return "\n".join(self.instructions)
         
@@ -202,6 +235,9 @@ if __name__ == "__main__":
         text = file(sys.argv[1]).read()
         interpreter = Interpreter(text)
         interpreter.compile()
-        print interpreter
+        if len(sys.argv) > 2:
+            interpreter.program().dump(sys.argv[2])
+        else:
+            print interpreter
     except IndexError:
-        print "usage: interpreter.py <filename>"
+        print "usage: interpreter.py <filename> [<packed output>]"
@@ -0,0 +1,386 @@
+import json
+import multiprocessing
+import threading
+import time
+from Queue import Queue, Empty
+
+from cache import ProgramCache
+from instructions import MUL_LATENCY
+from memory import Memory
+from mips import Mips, MIPS_MAX_AGE, MEMORY_SIZE, BRANCH_NOT_TAKEN, BRANCH_POLICIES
+
+PROCESSES = max(2, multiprocessing.cpu_count())
+MAX_PENDING = 32
+BATCH_WINDOW = 4 # jobs of one batch pending at once
+WALL_CLOCK = 10 # seconds per job
+GRACE = 2 # seconds a worker gets past its deadline before the job is given up
+CHECK_INTERVAL = 256 # cycles between deadline checks
+CHUNK_SIZE = 64 # states per streamed chunk
+
+# options of a headless run and their defaults
+CONFIGURATION = {"data_forwarding":False,
+                 "mul_latency":MUL_LATENCY,
+                 "branch_policy":BRANCH_NOT_TAKEN,
+                 "memory_size":MEMORY_SIZE}
+MAX_MUL_LATENCY = 100
+MAX_MEMORY_SIZE = 1 << 20
+
+_programs = None
+
+
+class JobTimeout(Exception):
+    """The job ran past its wall-clock budget and was cancelled."""
+
+
+class PoolBusy(Exception):
+    """Too many jobs are already waiting for a worker."""
+
+
+def _call(function, args):
+    """
+    Worker side of a job: `function(*args)` as a `(failed, value)` pair, so
+    that errors reach the result callback too.
+    """
+    try:
+        return False, function(*args)
+    except Exception as e:
+        return True, e
+
+def configuration(options):
+    """
+    `options` completed with the `CONFIGURATION` defaults. Raises
+    ValueError for unknown options or values out of range.
+    """
+    if not isinstance(options, dict):
+        raise ValueError("configuration must be an object")
+    unknown = set(options) - set(CONFIGURATION)
+    if unknown:
+        raise ValueError("unknown options: %s" % ", ".join(sorted(unknown)))
+
+    result = dict(CONFIGURATION, **options)
+    if result["data_forwarding"] not in (True, False, 0, 1):
+        raise ValueError("data_forwarding must be a boolean")
+    result["data_forwarding"] = bool(result["data_forwarding"])
+    for name, maximum in (("mul_latency", MAX_MUL_LATENCY), ("memory_size", MAX_MEMORY_SIZE)):
+        value = result[name]
+        if isinstance(value, bool) or not isinstance(value, (int, long)) or not 1 <= value <= maximum:
+            raise ValueError("%s must be an integer from 1 to %d" % (name, maximum))
+    if result["branch_policy"] not in BRANCH_POLICIES:
+        raise ValueError("branch_policy must be one of %s" % ", ".join(BRANCH_POLICIES))
+    return result
+
+def _init_worker(cache_directory):
+    global _programs
+    if cache_directory is not None:
+        _programs = ProgramCache(cache_directory)
+
+def _load(text):
+    return _programs.load(text) if _programs is not None else text
+
+def _check(mips, deadline):
+    if mips.clock % CHECK_INTERVAL == 0 and time.time() > deadline:
+        raise JobTimeout("cancelled after %d cycles" % mips.clock)
+
+def run(mips, life, deadline, record_history=True):
+    """
+    `Mips.run` that stops at `life` cycles, the cycle budget, and raises
+    `JobTimeout` once `deadline` has passed.
+    """
+    if not record_history:
+        while not mips.step(life):
+            _check(mips, deadline)
+        return mips.stats()
+
+    for state in mips.iter_states(life):
+        mips.history.append(state)
+        _check(mips, deadline)
+
+def execute(text, data_forwarding, delta_history, life, deadline):
+    """JSON of the execution history, as returned by /execute."""
+    mips = Mips(_load(text), data_forwarding=data_forwarding, delta_history=delta_history)
+    run(mips, life, deadline)
+    return json.dumps(mips.history.serialize() if delta_history else mips.history)
+
+def execute_stream(text, data_forwarding, delta_history, life, chunks, deadline):
+    """
+    `execute` that also puts the history on the `chunks` queue while it
+    runs, as JSON of every `CHUNK_SIZE` new states: a list of states, or
+    the new `deltas` and `phases` (and the `keyframe` first) of a delta
+    history.
+    """
+    mips = Mips(_load(text), data_forwarding=data_forwarding, delta_history=delta_history)
+    history = mips.history
+    sent = [0, 0] # states and phases already put on `chunks`
+
+    def flush():
+        if delta_history:
+            chunk = {"deltas":history.deltas[max(0, sent[0] - 1):],
+                     "phases":history.phases[sent[1]:]}
+            if sent[0] == 0:
+                chunk["keyframe"] = history.keyframe
+            sent[1] = len(history.phases)
+        else:
+            chunk = history[sent[0]:]
+        sent[0] = len(history)
+        chunks.put(json.dumps(chunk))
+
+    for state in mips.iter_states(life):
+        history.append(state)
+        _check(mips, deadline)
+        if len(history) - sent[0] >= CHUNK_SIZE:
+            flush()
+    if len(history) > sent[0]:
+        flush()
+    return json.dumps(history.serialize() if delta_history else history)
+
+def _configured(text, options):
+    options = dict(CONFIGURATION, **options)
+    return Mips(_load(text), data_forwarding=options["data_forwarding"],
+                mul_latency=options["mul_latency"], branch_policy=options["branch_policy"],
+                memory=Memory(size=options["memory_size"]))
+
+def stats(text, options, life, deadline):
+    """`Mips.stats()` of a headless run with the `configuration` in `options`."""
+    return run(_configured(text, options), life, deadline, record_history=False)
+
+def final_state(text, options, life, deadline):
+    """
+    Stats, registers and the non-zero memory words, as `[address, value]`
+    pairs, at the end of a headless run.
+    """
+    mips = _configured(text, options)
+    stats = run(mips, life, deadline, record_history=False)
+    return {"stats":stats,
+            "registers":mips.registers.current_state(),
+            "memory":[[address, value] for address, value in enumerate(mips.memory.snapshot())
+                      if value]}
+
+def batch(pool, texts, options=None, life=MIPS_MAX_AGE, **kwargs):
+    """
+    Run every program of `texts`, any iterable, headless on `pool` and
+    yield one `final_state` dict per program as soon as it finishes, with
+    its submission `index`, or an `error` (TIMEOUT, INVALID_TEXT or
+    SIMULATION_ERROR).
+    At most `BATCH_WINDOW` of them are pending at once, so a batch never
+    holds every pool slot. Keywords go to `SimulationPool.map_unordered`.
+    """
+    kwargs.setdefault("window", BATCH_WINDOW)
+    options = configuration(options or {})
+    calls = ((final_state, (text, options, life)) for text in texts)
+    for job in pool.map_unordered(calls, **kwargs):
+        try:
+            result = job.get()
+        except JobTimeout:
+            result = {"error":"TIMEOUT"}
+        except ValueError:
+            result = {"error":"INVALID_TEXT"}
+        except Exception:
+            result = {"error":"SIMULATION_ERROR"}
+        result["index"] = job.index
+        yield result
+
+
+class Job(object):
+    """Handle of one submitted simulation."""
+
+    def __init__(self, index, deadline, release=None):
+        self.index = index
+        self.deadline = deadline
+        self._release = release
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._failed = False
+        self._value = None
+
+    def _free(self):
+        """Give the pool slot of the job back, once."""
+        with self._lock:
+            release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def _finish(self, outcome):
+        self._failed, self._value = outcome
+        self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def expired(self):
+        return not self.ready() and time.time() > self.deadline + GRACE
+
+    def get(self):
+        """
+        The job result. Raises what the job raised, or `JobTimeout` when
+        there is no result `GRACE` seconds after the deadline. The slot of
+        such a job is given back, in case its worker died.
+        """
+        if not self._done.wait(max(0, self.deadline + GRACE - time.time())):
+            self._free()
+            raise JobTimeout("no result after the deadline")
+        if self._failed:
+            raise self._value
+        return self._value
+
+
+class SimulationPool(object):
+    """
+    Bounded pool of worker processes running simulations off the request
+    thread. At most `max_pending` jobs wait or run at once; each one gets a
+    `wall_clock` budget in seconds, checked by the worker every
+    `CHECK_INTERVAL` cycles. Workers load programs through a `ProgramCache`
+    on `cache_directory`. The worker processes and the manager process
+    holding the queues of streamed jobs are forked by `start()`, or else on
+    first use; servers should start them before any thread or connection
+    the children could inherit exists.
+    """
+
+    def __init__(self, processes=PROCESSES, max_pending=MAX_PENDING,
+                 wall_clock=WALL_CLOCK, cache_directory=None):
+        self.processes = processes
+        self.wall_clock = wall_clock
+        self.cache_directory = cache_directory
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._manager = None
+
+    def start(self):
+        """Fork the worker and manager processes, unless they are running."""
+        self._workers()
+        self._queue_manager()
+
+    def _workers(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes, _init_worker,
+                                                  (self.cache_directory,))
+            return self._pool
+
+    def _queue_manager(self):
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager
+
+    def _acquire(self, timeout):
+        # the semaphores of Python 2 have no timed acquire
+        deadline = time.time() + timeout
+        while not self._pending.acquire(False):
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Start `function(*args, deadline)` in a worker and return its `Job`.
+        Keywords: `wall_clock` overrides the pool budget, `block` waits for
+        a free slot up to `timeout` seconds (the pool budget plus `GRACE` by
+        default) instead of raising `PoolBusy` at once, `index` is stored on
+        the job and `finished` is a queue the job is put in once it is done.
+        """
+        wall_clock = kwargs.get("wall_clock", self.wall_clock)
+        timeout = kwargs.get("timeout", self.wall_clock + GRACE) if kwargs.get("block") else 0
+        if not self._acquire(timeout):
+            raise PoolBusy()
+        job = Job(kwargs.get("index"), time.time() + wall_clock, self._pending.release)
+        finished = kwargs.get("finished")
+
+        def callback(outcome):
+            job._free()
+            job._finish(outcome)
+            if finished is not None:
+                finished.put(job)
+
+        try:
+            self._workers().apply_async(_call, (function, args + (job.deadline,)),
+                                        callback=callback)
+        except Exception:
+            job._free()
+            raise
+        return job
+
+    def run(self, function, *args, **kwargs):
+        """Run one job and return its result, see `submit` and `Job.get`."""
+        return self.submit(function, *args, **kwargs).get()
+
+    def stream(self, function, *args, **kwargs):
+        """
+        Start `function(*args, chunks, deadline)` in a worker and return its
+        `Job` and an iterator over what it puts on the `chunks` queue, which
+        ends once the job is done or expired. Keywords go to `submit`.
+        """
+        chunks = self._queue_manager().Queue()
+        job = self.submit(function, *(args + (chunks,)), **kwargs)
+
+        def received():
+            while not job.ready():
+                try:
+                    yield chunks.get(timeout=0.1)
+                except Empty:
+                    if job.expired():
+                        return
+            # the worker put every chunk before it returned
+            while True:
+                try:
+                    yield chunks.get_nowait()
+                except Empty:
+                    return
+
+        return job, received()
+
+    def map_unordered(self, calls, **kwargs):
+        """
+        Submit every `(function, args)` pair of `calls` and yield the jobs in
+        completion order, each with its submission `index`. Jobs with no
+        result past their deadline are yielded too; `get` raises for them.
+        By default submitting waits for free slots; `block=False` raises
+        `PoolBusy` instead. With `window` at most that many of the jobs are
+        pending at once. Other keywords go to `submit`.
+        """
+        kwargs.setdefault("block", True)
+        window = kwargs.pop("window", None)
+        finished = Queue()
+        running = {}
+
+        def done(wait):
+            """Jobs done or expired since the last call, at least one if `wait`."""
+            jobs = []
+            if wait:
+                deadline = min(job.deadline for job in running.values()) + GRACE
+                try:
+                    jobs.append(finished.get(timeout=max(0, deadline - time.time())))
+                except Empty:
+                    for job in running.values():
+                        if job.expired():
+                            job._free()
+                            jobs.append(job)
+            while True:
+                try:
+                    jobs.append(finished.get_nowait())
+                except Empty:
+                    break
+            return [job for job in jobs if running.pop(job.index, None) is not None]
+
+        for index, (function, args) in enumerate(calls):
+            while window is not None and len(running) >= window:
+                for job in done(True):
+                    yield job
+            running[index] = self.submit(function, *args, index=index, finished=finished, **kwargs)
+            for job in done(False):
+                yield job
+
+        while running:
+            for job in done(True):
+                yield job
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
@@ -1,15 +1,271 @@
+import mmap
+import struct
+import sys
+from array import array
+from collections import deque
+from itertools import islice
 
+from word import to_word, words, WORD_TYPECODE
 
-class Memory(object):
-    def __init__(self, size=1024):
-        self._array = [0] * size
-        self.history = []
+PAGE_SIZE = 1024 # words, 4 KiB
+ADDRESS_SPACE = 1 << 30 # words, a 32-bit byte address space
+WORD_SIZE = 4
+HISTORY_WINDOW = 64
+
+_struct_byteorder = {"little":"<", "big":">"}
+
+
+def _map_image(filename, size=None, readonly=False, private=False):
+    """
+    Open `filename` and mmap `size` words of it, growing the file if needed.
+    A `private` map is copy-on-write: writes never reach the file.
+    """
+    image = open(filename, "rb" if readonly or private else "r+b")
+    try:
+        if size is not None and not (readonly or private):
+            image.seek(0, 2)
+            if image.tell() < size * WORD_SIZE:
+                image.truncate(size * WORD_SIZE)
+        length = size * WORD_SIZE if size is not None else 0
+        if private:
+            access = mmap.ACCESS_COPY
+        else:
+            access = mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        return image, mmap.mmap(image.fileno(), length, access=access)
+    except Exception:
+        image.close()
+        raise
+
+
+class BaseMemory(object):
+    """
+    Access log shared by the memory classes. `history` is a ring buffer with
+    the last `history_window` loads and stores; for a full log, `sink` is
+    called with every entry instead of keeping them in memory.
+    """
+
+    def __init__(self, history_window=HISTORY_WINDOW, sink=None):
+        self.history = deque(maxlen=history_window)
+        self.sink = sink
+        self._log = self.history.append if sink is None else self._log_to_sink
+
+    def _log_to_sink(self, entry):
+        self.history.append(entry)
+        self.sink(entry)
+
+    def recent(self, count):
+        """The last `count` history entries, oldest first."""
+        entries = list(islice(reversed(self.history), count))
+        entries.reverse()
+        return entries
+
+    def reset_history(self, entries):
+        self.history.clear()
+        self.history.extend(entries)
+
+
+class Memory(BaseMemory):
+    """Word addressed memory of signed 32-bit values, backed by an `array`."""
+
+    def __init__(self, size=1024, history_window=HISTORY_WINDOW, sink=None):
+        BaseMemory.__init__(self, history_window, sink)
+        self.size = size
+        self._array = words(size)
         
     def __getitem__(self, key):
         value = self._array[key]
-        self.history.append(('lw', key, value))
+        self._log(('lw', key, value))
         return value
         
     def __setitem__(self, key, value):
-        self.history.append(('sw', key, value))
+        value = to_word(value)
+        self._log(('sw', key, value))
         self._array[key] = value
+
+    def snapshot(self):
+        """Copy of the whole memory, taken as a single buffer copy."""
+        return self._array[:]
+
+    def restore(self, snapshot):
+        self._array = snapshot[:]
+
+    def view(self):
+        """Zero-copy, read-only view of the raw memory words."""
+        return buffer(self._array)
+
+    def blank(self):
+        """Empty memory of the same kind, used to replay checkpoints."""
+        return Memory(size=self.size, history_window=self.history.maxlen)
+
+    @classmethod
+    def load_image(cls, filename, byteorder="little", size=None):
+        """
+        Memory initialized from a raw image of 32-bit words. The image is
+        mapped and copied into the word array in one go.
+        """
+        image, mapped = _map_image(filename, readonly=True)
+        try:
+            loaded = array(WORD_TYPECODE)
+            loaded.fromstring(mapped[:len(mapped) - len(mapped) % WORD_SIZE])
+        finally:
+            mapped.close()
+            image.close()
+        if byteorder != sys.byteorder:
+            loaded.byteswap()
+
+        memory = cls(size=size if size is not None else len(loaded))
+        memory._array[:len(loaded)] = loaded[:memory.size]
+        return memory
+
+    def dump_image(self, filename, byteorder="little"):
+        """Write the memory words to `filename` as a raw image."""
+        dumped = self._array[:]
+        if byteorder != sys.byteorder:
+            dumped.byteswap()
+        open(filename, "wb").close()
+        image, mapped = _map_image(filename, size=self.size)
+        try:
+            mapped[:] = dumped.tostring()
+        finally:
+            mapped.close()
+            image.close()
+
+
+class PagedMemory(BaseMemory):
+    """
+    Sparse memory for large address spaces. Words live in `PAGE_SIZE` pages
+    allocated on first write and found through the `_pages` table; reading
+    an untouched address returns 0 without allocating anything.
+    """
+
+    def __init__(self, size=ADDRESS_SPACE, history_window=HISTORY_WINDOW, sink=None):
+        BaseMemory.__init__(self, history_window, sink)
+        self.size = size
+        self._pages = {}
+        self._dirty = set()
+        self._last_snapshot = {}
+
+    def __getitem__(self, key):
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        page = self._pages.get(key // PAGE_SIZE)
+        value = page[key % PAGE_SIZE] if page is not None else 0
+        self._log(('lw', key, value))
+        return value
+
+    def __setitem__(self, key, value):
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        value = to_word(value)
+        self._log(('sw', key, value))
+        number = key // PAGE_SIZE
+        try:
+            page = self._pages[number]
+        except KeyError:
+            page = self._pages[number] = words(PAGE_SIZE)
+        page[key % PAGE_SIZE] = value
+        self._dirty.add(number)
+
+    def blank(self):
+        return PagedMemory(size=self.size, history_window=self.history.maxlen)
+
+    def touched_pages(self):
+        return sorted(self._pages)
+
+    def snapshot(self):
+        """
+        Page table of read-only page copies. Only pages written since the
+        previous snapshot are copied; the others are shared with it.
+        """
+        snapshot = dict(self._last_snapshot)
+        for number in self._dirty:
+            snapshot[number] = self._pages[number][:]
+        self._dirty = set()
+        self._last_snapshot = snapshot
+        return snapshot
+
+    def restore(self, snapshot):
+        self._pages = dict((number, page[:]) for number, page in snapshot.items())
+        self._dirty = set()
+        self._last_snapshot = snapshot
+
+
+class MappedMemory(BaseMemory):
+    """
+    Memory backed directly by an mmapped raw image of 32-bit words in the
+    given byte order, so loading and inspecting large data sets costs no
+    copy. Writes go straight to the file, unless the memory is `private`;
+    `close()` flushes it.
+
+    The value each word had before its first write is kept, so snapshots
+    only hold the written words and `blank()` rebuilds the initial image
+    on a private map, without reading the whole file.
+    """
+
+    def __init__(self, filename, byteorder="little", size=None, readonly=False, private=False,
+                 history_window=HISTORY_WINDOW, sink=None):
+        BaseMemory.__init__(self, history_window, sink)
+        self._word = struct.Struct(_struct_byteorder[byteorder] + "i")
+        self._image, self._map = _map_image(filename, size=size, readonly=readonly,
+                                            private=private)
+        self._closed = False
+        self._original = {}
+        self.filename = filename
+        self.byteorder = byteorder
+        self.size = len(self._map) // WORD_SIZE
+
+    def __getitem__(self, key):
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        value = self._word.unpack_from(self._map, key * WORD_SIZE)[0]
+        self._log(('lw', key, value))
+        return value
+
+    def __setitem__(self, key, value):
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        value = to_word(value)
+        self._log(('sw', key, value))
+        self._put(key, value)
+
+    def _get(self, key):
+        return self._word.unpack_from(self._map, key * WORD_SIZE)[0]
+
+    def _put(self, key, value):
+        if key not in self._original:
+            self._original[key] = self._get(key)
+        self._word.pack_into(self._map, key * WORD_SIZE, value)
+
+    def view(self):
+        return buffer(self._map)
+
+    def blank(self):
+        """Private map of the image as it was before any write."""
+        blank = MappedMemory(self.filename, self.byteorder, self.size, private=True,
+                             history_window=self.history.maxlen)
+        for key, value in self._original.items():
+            blank._word.pack_into(blank._map, key * WORD_SIZE, value)
+        return blank
+
+    def snapshot(self):
+        """The written words, as a dict of address to value."""
+        return dict((key, self._get(key)) for key in self._original)
+
+    def restore(self, snapshot):
+        for key in set(self._original) | set(snapshot):
+            self._put(key, snapshot[key] if key in snapshot else self._original[key])
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if not self._closed:
+            self._map.close()
+            self._image.close()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,27 +1,70 @@
 from __future__ import division
 
+from copy import deepcopy
+
 import instructions
-from instructions import Instruction, StallInstruction
+from instructions import MulInstruction, STALL, BRANCH, JUMP
 from registers import Registers
 from memory import Memory
+from history import DeltaHistory, MEMORY_WINDOW
+from program import Program, decode_line, is_packed
 
 REGISTERS_SIZE = 32
 MEMORY_SIZE = 100
 MIPS_MAX_AGE = 10000
+
+# predict not taken and flush on a taken branch, or stop fetching until it is resolved
+BRANCH_NOT_TAKEN = "not_taken"
+BRANCH_STALL = "stall"
+BRANCH_POLICIES = (BRANCH_NOT_TAKEN, BRANCH_STALL)
+
+
+def program_lines(text):
+    lines = text.split("\n") if text else []
+    return [line for line in lines if line.strip()]
+
+def load_program(source):
+    """
+    Program lines and their decoded templates. `source` is bytecode text, a
+    `Program` or a buffer/mmap holding a packed one. Raises ValueError for a
+    line that is not a known instruction.
+    """
+    if is_packed(source):
+        program = source if isinstance(source, Program) else Program.from_buffer(source)
+        return program, program.decode()
+    lines = program_lines(source)
+    return lines, [decode_line(line) for line in lines]
+
+def with_mul_latency(decoded_instructions, latency):
+    """Copy of `decoded_instructions` where mul spends `latency` cycles in execute."""
+    return [template._replace(fields=template.fields + (("execution_time", latency),))
+            if template.instruction_class is MulInstruction else template
+            for template in decoded_instructions]
+
     
 class Mips(object):
-    def __init__(self, instructions=None, data_forwarding=False):
-        instructions = instructions.split("\n") if instructions else []
-        self.instructions = [instruction for instruction in instructions if instruction.strip()]
+    def __init__(self, instructions=None, data_forwarding=False, delta_history=False,
+                 checkpoint_interval=None, memory=None, mul_latency=None,
+                 branch_policy=BRANCH_NOT_TAKEN, replayable=False):
+        self.instructions, self.decoded_instructions = load_program(instructions)
+        if mul_latency is not None:
+            self.decoded_instructions = with_mul_latency(self.decoded_instructions, mul_latency)
+        self._program_end = 4 * len(self.instructions)
         self.data_forwarding = data_forwarding
+        self.branch_policy = branch_policy
+        self._stall_branches = branch_policy == BRANCH_STALL
         
         self.registers = Registers(size=REGISTERS_SIZE)
-        self.memory = Memory(size=MEMORY_SIZE)
-        self.history = []
+        self.memory = memory if memory is not None else Memory(size=MEMORY_SIZE)
+        self.history = DeltaHistory() if delta_history else []
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = {}
 
         self.pc = 0
         self.clock = 0
         self.instructions_completed = 0
+        self.stalls = {"data":0, "execute":0, "flush":0, "branch":0}
+        self._in_flight = 0
         
         self._if = InstructionFetch(self)
         self._id = InstructionDecode(self)
@@ -29,59 +72,173 @@ class Mips(object):
         self._mem = MemoryAccess(self)
         self._wb = WriteBack(self)
         self.pipeline = (self._if, self._id, self._ex, self._mem, self._wb)
+        self._latches = tuple(reversed(zip(self.pipeline[:-1], self.pipeline[1:])))
+        # `memory` may come preloaded, so replays without checkpoints start
+        # from a copy of it, taken only when asked for
+        self._initial_checkpoint = self.checkpoint() if replayable else None
+
+    def run(self, life=MIPS_MAX_AGE, record_history=True):
+        """
+        Execute the program. With `record_history` False no per-cycle state is
+        built at all and only the final `stats()` are returned.
+        """
+        if not record_history:
+            while not self.step(life):
+                pass
+            return self.stats()
+
+        for state in self.iter_states(life):
+            self.history.append(state)
 
-    def run(self, life=MIPS_MAX_AGE):
+    def iter_states(self, life=MIPS_MAX_AGE):
+        """
+        Execute the program, yielding the state of every cycle as soon as it
+        is produced. Nothing is kept in `history`.
+        """
         while True:
-            self.history.append(self.current_state())
-            self.execute_pipeline()
-            self.clock += 1
-            
-            if self.clock > life or (all(isinstance(p.instruction, StallInstruction) for p in self.pipeline) and self.pc == 4 * len(self.instructions)):
-                self.history.append(self.current_state())
+            yield self.current_state()
+            if self.step(life):
+                yield self.current_state()
                 break
 
+    def step(self, life=MIPS_MAX_AGE):
+        """Execute one cycle and return True when the program has finished."""
+        if self.checkpoint_interval and self.clock % self.checkpoint_interval == 0:
+            self.checkpoints[self.clock] = self.checkpoint()
+        self.execute_pipeline()
+        self.clock += 1
+        return self.clock > life or (self._in_flight == 0 and self.pc == self._program_end)
+
     def _go_forward_pipeline(self):
-        if self.pipeline[4].done:
-            self.pipeline[4].instruction = None
+        wb = self._wb
+        if wb.done:
+            if wb._instruction is not STALL:
+                self._in_flight -= 1
+            wb._instruction = None
+            wb.done = True
                         
-        for a, b in reversed(zip(self.pipeline[:-1], self.pipeline[1:])):
-            if a.done and b.instruction is None:
-                b.instruction = a.instruction
-                a.instruction = None
+        for a, b in self._latches:
+            if a.done and b._instruction is None:
+                instruction = a._instruction
+                b._instruction = instruction
+                b.done = instruction is STALL or instruction is None
+                a._instruction = None
+                a.done = True
     
     def execute_pipeline(self):
         self._go_forward_pipeline()
 
         for phase in self.pipeline:
             phase.execute()
-            if not phase.instruction:
-                phase.instruction = StallInstruction()
+            if phase._instruction is None:
+                phase._instruction = STALL
+
+        if not self._id.done:
+            self.stalls["data"] += 1
+        if not self._ex.done:
+            self.stalls["execute"] += 1
 
     def jump(self, pc):
+        for phase in (self._if, self._id):
+            if phase.instruction and phase.instruction is not STALL:
+                self.stalls["flush"] += 1
+                self._in_flight -= 1
         self._if.instruction.unlock_registers(self)
-        self._if.instruction = StallInstruction()
+        self._if.instruction = STALL
         self._id.instruction.unlock_registers(self)
-        self._id.instruction = StallInstruction()
+        self._id.instruction = STALL
         self.pc = pc
     
+    def branch_pending(self):
+        """True while a branch or jump is decoded but not yet executed."""
+        for phase in (self._id, self._ex):
+            instruction = phase._instruction
+            if instruction is not None and (instruction.flags[BRANCH] or instruction.flags[JUMP]):
+                return True
+        return False
+
     def current_state(self):
         instructions_completed = self.instructions_completed
         throughput = instructions_completed / self.clock if self.clock > 0 else 0
     
         state = {"pipeline":[p.instruction.current_state() for p in self.pipeline],
                  "registers":self.registers.current_state(),
-                 "memory":self.memory.history[-4:],
+                 "memory":self.memory.recent(MEMORY_WINDOW),
                  "clock":self.clock,
                  "pc":self.pc,
                  "instructions_completed":instructions_completed,
                  "throughput":throughput}
         return state
+
+    def checkpoint(self):
+        """Full copy of the machine state, to be passed to `restore()`."""
+        return {"clock":self.clock,
+                "pc":self.pc,
+                "instructions_completed":self.instructions_completed,
+                "stalls":dict(self.stalls),
+                "in_flight":self._in_flight,
+                "memory":self.memory.snapshot(),
+                "memory_history":self.memory.recent(MEMORY_WINDOW),
+                # copied together so the scoreboard keeps pointing to the
+                # copied pipeline instructions
+                "machine":deepcopy((self.registers.snapshot(),
+                                    [(p.instruction, p.done) for p in self.pipeline]))}
+
+    def restore(self, checkpoint):
+        self.clock = checkpoint["clock"]
+        self.pc = checkpoint["pc"]
+        self.instructions_completed = checkpoint["instructions_completed"]
+        self.stalls = dict(checkpoint["stalls"])
+        self._in_flight = checkpoint["in_flight"]
+        self.memory.restore(checkpoint["memory"])
+        self.memory.reset_history(checkpoint["memory_history"])
+        registers, pipeline = deepcopy(checkpoint["machine"])
+        self.registers.restore(registers)
+        for phase, (instruction, done) in zip(self.pipeline, pipeline):
+            phase.instruction = instruction
+            phase.done = done
+
+    def state_at(self, cycle):
+        """
+        State of an already executed `cycle`, rebuilt by restoring the
+        nearest previous checkpoint, or the initial state, into a scratch
+        `Mips` and replaying. Needs a `checkpoint_interval` or `replayable`.
+        """
+        if not 0 <= cycle <= self.clock:
+            raise IndexError(cycle)
+        if cycle == self.clock:
+            return self.current_state()
+
+        mips = Mips(data_forwarding=self.data_forwarding, memory=self.memory.blank(),
+                    branch_policy=self.branch_policy)
+        mips.instructions = self.instructions
+        mips.decoded_instructions = self.decoded_instructions
+        mips._program_end = self._program_end
+        checkpoint = self._initial_checkpoint
+        if self.checkpoint_interval:
+            checkpoint = self.checkpoints.get(cycle - cycle % self.checkpoint_interval, checkpoint)
+        if checkpoint is None:
+            raise ValueError("replaying needs checkpoint_interval or replayable")
+        mips.restore(checkpoint)
+        while mips.clock < cycle:
+            mips.step(cycle)
+        return mips.current_state()
+
+    def stats(self):
+        instructions_completed = self.instructions_completed
+        return {"clock":self.clock,
+                "instructions_completed":instructions_completed,
+                "cpi":self.clock / instructions_completed if instructions_completed > 0 else 0,
+                "throughput":instructions_completed / self.clock if self.clock > 0 else 0,
+                "stalls":dict(self.stalls)}
         
     
 class MipsPhase(object):
+    __slots__ = ("_mips", "_instruction", "done")
+
     def __init__(self, mips):
         self._mips = mips
-        self._instruction = StallInstruction()
+        self._instruction = STALL
         self.done = True
         
     def execute(self):
@@ -89,7 +246,7 @@ class MipsPhase(object):
 
     def set_instruction(self, value):
         self._instruction = value
-        self.done = isinstance(value, StallInstruction) or value is None
+        self.done = value is STALL or value is None
         
     def get_instruction(self):
         return self._instruction
@@ -97,57 +254,59 @@ class MipsPhase(object):
     instruction = property(get_instruction, set_instruction)
 
 class InstructionFetch(MipsPhase):
+    __slots__ = ()
+
     def execute(self):
-        if not self.instruction:
-            instruction_number = int(self._mips.pc / 4)
-            
+        mips = self._mips
+        if self._instruction is None and mips._stall_branches and mips.branch_pending():
+            mips.stalls["branch"] += 1
+            self._instruction = STALL
+        elif self._instruction is None:
             try:
-                instruction = Instruction(self._mips.instructions[instruction_number])
-                instruction.pc = self._mips.pc
-                self._mips.pc += 4
+                instruction = mips.decoded_instructions[mips.pc >> 2]()
+                instruction.pc = mips.pc
+                mips.pc += 4
+                mips._in_flight += 1
             except IndexError:
                 instruction = None
             
-            self.instruction = instruction
+            self._instruction = instruction
 
-        self.done = not self.instruction is None
+        self.done = self._instruction is not None
 
     
 class InstructionDecode(MipsPhase):
-    def _on_register_changed(self, **kwargs):
-        for key, value in kwargs.items():
-            self.registers[key] = value
+    __slots__ = ()
 
     def execute(self):
-        if self.instruction:
-            self.done = self.instruction.instruction_decode(self._mips)
-        else:
-            self.done = True
+        instruction = self._instruction
+        self.done = instruction is None or instruction.instruction_decode(self._mips)
         
     
 class Execute(MipsPhase):
+    __slots__ = ()
+
     def execute(self):
-        if self.instruction:
-            self.done = self.instruction.execute(self._mips)
-        else:
-            self.done = True
+        instruction = self._instruction
+        self.done = instruction is None or instruction.execute(self._mips)
         
     
 class MemoryAccess(MipsPhase):
+    __slots__ = ()
+
     def execute(self):
-        if self.instruction:
-            self.done = self.instruction.memory_access(self._mips)
-        else:
-            self.done = True
+        instruction = self._instruction
+        self.done = instruction is None or instruction.memory_access(self._mips)
         
         
 class WriteBack(MipsPhase):
+    __slots__ = ()
+
     def execute(self):
-        if self.instruction:
-            self.done = self.instruction.write_back(self._mips)
-            if self.done and not isinstance(self.instruction, StallInstruction):
+        instruction = self._instruction
+        if instruction is not None:
+            self.done = instruction.write_back(self._mips)
+            if self.done and instruction is not STALL:
                 self._mips.instructions_completed += 1
         else:
             self.done = True
-    
-
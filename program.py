@@ -0,0 +1,295 @@
+import json
+import mmap
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import izip
+
+from instructions import (Instruction, InstructionTemplate, map_r_instruction_funct,
+                          map_i_instruction, map_j_instruction)
+from word import WORD_MASK, WORD_TYPECODE
+
+MAGIC = "MIPB"
+VERSION = 1
+
+# magic, version, reserved, word count, text table size, symbol count
+HEADER = struct.Struct("<4sHHIII")
+SYMBOL = struct.Struct("<IH")
+WORD = struct.Struct("<I")
+WORD_SIZE = 4
+# size of the JSON table of a `pack_decoded` string
+DECODED = struct.Struct("<I")
+
+# the only classes `load_decoded` accepts, by name
+INSTRUCTION_CLASSES = dict((instruction_class.__name__, instruction_class)
+                           for table in (map_r_instruction_funct, map_i_instruction,
+                                         map_j_instruction)
+                           for instruction_class in table.values())
+
+
+def decode_line(line):
+    """
+    `Instruction.decode` of a "bytecode ; text" line, raising ValueError
+    for an unknown opcode or funct.
+    """
+    try:
+        return Instruction.decode(line)
+    except KeyError:
+        raise ValueError("invalid instruction: %r" % line)
+
+def is_packed(source):
+    """
+    True when `source` is a `Program` or a binary `buffer` or `mmap`
+    holding a packed one. Strings are always program text.
+    """
+    if isinstance(source, Program):
+        return True
+    if not isinstance(source, (buffer, mmap.mmap)):
+        return False
+    return source[:len(MAGIC)] == MAGIC
+
+def _pack_symbols(symbols):
+    chunks = []
+    for address, name in sorted((address, name) for name, address in symbols.items()):
+        name = name.encode("utf-8")
+        chunks.append(SYMBOL.pack(address, len(name)))
+        chunks.append(name)
+    return "".join(chunks)
+
+
+class Program(object):
+    """
+    Binary program: packed little-endian 32-bit instruction words, an
+    optional string table with the disassembly text of each word and a
+    symbol section mapping labels to byte addresses.
+
+    Layout: `HEADER`, the words, the string table (texts joined by "\\n")
+    and one `SYMBOL` record plus name per label.
+
+    Iterating yields the same "bytecode ; text" lines the interpreter
+    prints, built on demand.
+    """
+
+    def __init__(self, words=(), texts=None, symbols=None):
+        self.words = array(WORD_TYPECODE, [word - (1 << 32) if word > 0x7fffffff else word
+                                           for word in words])
+        self.texts = list(texts) if texts else []
+        self.symbols = dict(symbols or {})
+        self._decoded = None
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Pack "bytecode ; text" lines as printed by the interpreter. Raises
+        ValueError for a line that is not a 32-bit binary word.
+        """
+        words = []
+        texts = []
+        for line in lines:
+            bytecode, _, text = line.partition(";")
+            word = int(bytecode.strip(), 2)
+            if not 0 <= word <= WORD_MASK:
+                raise ValueError("invalid instruction: %r" % line)
+            words.append(word)
+            texts.append(text.strip())
+        return cls(words, texts)
+
+    @classmethod
+    def from_buffer(cls, data):
+        """
+        Load a packed program from a string, `buffer` or `mmap`. Raises
+        ValueError when `data` is not a whole packed program.
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("truncated program header")
+        magic, version, _, count, text_size, symbol_count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("not a packed program")
+        if version != VERSION:
+            raise ValueError("unsupported program version %d" % version)
+        if HEADER.size + count * WORD_SIZE + text_size > len(data):
+            raise ValueError("truncated program")
+
+        program = cls()
+        offset = HEADER.size
+        end = offset + count * WORD_SIZE
+        program.words.fromstring(data[offset:end])
+        if sys.byteorder != "little":
+            program.words.byteswap()
+
+        offset, end = end, end + text_size
+        if text_size:
+            program.texts = data[offset:end].decode("utf-8").split("\n")
+
+        offset = end
+        for _ in xrange(symbol_count):
+            if offset + SYMBOL.size > len(data):
+                raise ValueError("truncated program symbols")
+            address, length = SYMBOL.unpack_from(data, offset)
+            offset += SYMBOL.size
+            if offset + length > len(data):
+                raise ValueError("truncated program symbols")
+            program.symbols[data[offset:offset + length].decode("utf-8")] = address
+            offset += length
+        return program
+
+    @classmethod
+    def load(cls, filename):
+        """Load a packed program by mapping `filename`."""
+        with open(filename, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return cls.from_buffer(mapped)
+            finally:
+                mapped.close()
+
+    def to_bytes(self):
+        words = self.words[:]
+        if sys.byteorder != "little":
+            words.byteswap()
+        texts = u"\n".join(self.texts).encode("utf-8")
+        return "".join([HEADER.pack(MAGIC, VERSION, 0, len(words), len(texts), len(self.symbols)),
+                        words.tostring(), texts, _pack_symbols(self.symbols)])
+
+    def dump(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+    def text(self, index):
+        return self.texts[index] if index < len(self.texts) else ""
+
+    def decode(self):
+        """
+        `InstructionTemplate` per word. Each distinct word is decoded once;
+        repeated words only get their own text. The result is kept, so a
+        program in memory is never decoded again. Raises ValueError for a
+        word that is not a known instruction.
+        """
+        if self._decoded is not None:
+            return self._decoded
+
+        decoded_words = {}
+        decoded = []
+        append = decoded.append
+        texts = self.texts + [""] * (len(self.words) - len(self.texts))
+        for word, text in izip(self.words, texts):
+            try:
+                instruction_class, fields = decoded_words[word]
+            except KeyError:
+                template = decode_line(format(word & WORD_MASK, "032b"))
+                instruction_class = template.instruction_class
+                fields = tuple(field for field in template.fields if field[0] != "text")
+                decoded_words[word] = instruction_class, fields
+            append(InstructionTemplate(instruction_class, fields + (("text", text),)))
+        self._decoded = decoded
+        return decoded
+
+    def pack_decoded(self):
+        """
+        `decode()` as a string for `load_decoded`: a JSON table of the
+        distinct instruction classes, by name, and fields, then one table
+        index per word.
+        """
+        table = []
+        rows = {}
+        indexes = array(WORD_TYPECODE)
+        for word, template in izip(self.words, self.decode()):
+            if word not in rows:
+                rows[word] = len(table)
+                table.append((template.instruction_class.__name__,
+                              [field for field in template.fields if field[0] != "text"]))
+            indexes.append(rows[word])
+        if sys.byteorder != "little":
+            indexes.byteswap()
+        table = json.dumps(table)
+        return DECODED.pack(len(table)) + table + indexes.tostring()
+
+    def load_decoded(self, data):
+        """
+        Set the `decode()` result from a `pack_decoded` string, without
+        decoding any word. Raises ValueError when `data` does not match the
+        program or names a class outside `INSTRUCTION_CLASSES`.
+        """
+        if len(data) < DECODED.size:
+            raise ValueError("truncated decoded table")
+        size, = DECODED.unpack_from(data, 0)
+        rows = []
+        for name, fields in json.loads(data[DECODED.size:DECODED.size + size]):
+            if name not in INSTRUCTION_CLASSES:
+                raise ValueError("unknown instruction class %r" % name)
+            fields = tuple((str(field), value if isinstance(value, (int, long)) else str(value))
+                           for field, value in fields)
+            rows.append((INSTRUCTION_CLASSES[name], fields))
+
+        indexes = array(WORD_TYPECODE)
+        indexes.fromstring(data[DECODED.size + size:])
+        if sys.byteorder != "little":
+            indexes.byteswap()
+        if len(indexes) != len(self.words) or (
+                indexes and not 0 <= min(indexes) <= max(indexes) < len(rows)):
+            raise ValueError("decoded table does not match the program")
+
+        texts = self.texts + [""] * (len(self.words) - len(self.texts))
+        self._decoded = [InstructionTemplate(rows[index][0], rows[index][1] + (("text", text),))
+                         for index, text in izip(indexes, texts)]
+        return self._decoded
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        line = format(self.words[index] & WORD_MASK, "032b")
+        text = self.text(index)
+        return "%s ; %s" % (line, text) if text else line
+
+    def __iter__(self):
+        for index in xrange(len(self.words)):
+            yield self[index]
+
+
+class ProgramWriter(object):
+    """
+    Writes a packed program to the seekable binary file `output` one word at
+    a time. Words already written can be patched in place; texts are spooled
+    to a temporary file and copied after the words on `close`.
+    """
+
+    def __init__(self, output, texts=True):
+        self.output = output
+        self.count = 0
+        self._start = output.tell()
+        self._texts = tempfile.TemporaryFile() if texts else None
+        self._patched_texts = {}
+        output.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+
+    def append(self, word, text=""):
+        self.output.write(WORD.pack(word & WORD_MASK))
+        if self._texts is not None:
+            self._texts.write(text.encode("utf-8") + "\n")
+        self.count += 1
+
+    def patch(self, index, word, text=""):
+        self.output.seek(self._start + HEADER.size + index * WORD_SIZE)
+        self.output.write(WORD.pack(word & WORD_MASK))
+        self.output.seek(0, 2)
+        if self._texts is not None:
+            self._patched_texts[index] = text.encode("utf-8") + "\n"
+
+    def close(self, symbols=None):
+        symbols = symbols or {}
+        text_size = 0
+        if self._texts is not None:
+            self._texts.seek(0)
+            for index, line in enumerate(self._texts):
+                line = self._patched_texts.get(index, line)
+                if index == self.count - 1:
+                    line = line[:-1]
+                self.output.write(line)
+                text_size += len(line)
+            self._texts.close()
+        self.output.write(_pack_symbols(symbols))
+
+        self.output.seek(self._start)
+        self.output.write(HEADER.pack(MAGIC, VERSION, 0, self.count, text_size, len(symbols)))
+        self.output.seek(0, 2)
@@ -1,5 +1,6 @@
 from copy import copy
-import logging
+
+from word import to_word, words
 
 class RegisterInUseException(BaseException):
     def __init__(self, value):
@@ -10,44 +11,76 @@ class RegisterInUseException(BaseException):
         
     
 class Registers(object):
+    """
+    Register file with a scoreboard: `_pending` counts the in-flight writers
+    of each register and `_owner` remembers the youngest of them, the only
+    one allowed to forward a value through `_tmp`.
+    """
+
     def __init__(self, size=32):
-        self._array = [0] * size
-        self._locks = set()
+        self._array = words(size)
+        self._pending = [0] * size
+        self._owner = {}
         self._tmp = {}
         
     def __getitem__(self, key):
-        if key in self._locks:
+        if not isinstance(key, int):
+            raise AttributeError()
+
+        if self._pending[key]:
             try:
                 return self._tmp[key]
             except KeyError:
                 raise RegisterInUseException(key)
-
-        if isinstance(key, int):
-            value = self._array[key]
-        else:
-            raise AttributeError()
-        return value
+        return self._array[key]
             
     def __setitem__(self, key, value):
-        if key in self._locks:
+        if not isinstance(key, int):
+            raise AttributeError()
+
+        value = to_word(value)
+        if self._pending[key]:
             self._tmp[key] = value
-        elif isinstance(key, int):
-            self._array[key] = value
         else:
-            raise AttributeError()
-            
-    def lock(self, key):
-        self._locks.add(key)
+            self._array[key] = value
+
+    def ready(self, key):
+        """True if `key` can be read: no pending writer or a forwarded value."""
+        return not self._pending[key] or key in self._tmp
+
+    def lock(self, key, owner=None):
+        self._pending[key] += 1
+        self._owner[key] = owner
+        self._tmp.pop(key, None)
         
     def unlock(self, key):
-        try:
-            self._locks.remove(key)
-            try:
-                self._tmp.pop(key)
-            except KeyError:
-                pass
-        except KeyError:
-            logging.info("Trying to unlock '%s' but it is not locked.", key)
+        if self._pending[key]:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                self._tmp.pop(key, None)
+                self._owner.pop(key, None)
+
+    def forward(self, key, value, owner):
+        """Forward `value` to readers, unless a younger writer of `key` exists."""
+        value = to_word(value)
+        if not self._pending[key]:
+            self._array[key] = value
+        elif self._owner.get(key) is owner:
+            self._tmp[key] = value
+
+    def commit(self, key, value):
+        """Write back `value`; forwarded values of pending writers are kept."""
+        self._array[key] = to_word(value)
     
     def current_state(self):
-        return copy(self._array)
+        return self._array.tolist()
+
+    def snapshot(self):
+        return (self._array[:], copy(self._pending), copy(self._owner), copy(self._tmp))
+
+    def restore(self, snapshot):
+        array, pending, owner, tmp = snapshot
+        self._array = array[:]
+        self._pending = copy(pending)
+        self._owner = copy(owner)
+        self._tmp = copy(tmp)
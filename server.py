@@ -1,11 +1,45 @@
 #!/usr/bin/env python
+import json
+import os
+import tempfile
 import traceback
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
 
 import bottle
-from bottle import route, request, static_file
+from bottle import route, request, response, static_file
 
-from mips import Mips
-from interpreter import Interpreter
+import jobs
+from mips import MIPS_MAX_AGE, MEMORY_SIZE
+from cache import ProgramCache, ResultCache, result_key
+from jobs import SimulationPool, JobTimeout, PoolBusy
+from sessions import SessionStore
+
+MAX_CONFIGURATIONS = 64
+MAX_BATCH = 500
+# private to the user running the server, see ProgramCache
+CACHE_DIRECTORY = os.environ.get("MIPSSIM_CACHE_DIR",
+                                 os.path.join(tempfile.gettempdir(), "mipssim-programs-%d" % os.getuid()))
+# optional sqlite file keeping simulation results across restarts
+RESULTS_DATABASE = os.environ.get("MIPSSIM_RESULTS_DB")
+
+sessions = SessionStore()
+programs = ProgramCache(CACHE_DIRECTORY)
+results = ResultCache(filename=RESULTS_DATABASE)
+pool = SimulationPool(cache_directory=CACHE_DIRECTORY)
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def cached_result(key, simulate):
+    """JSON returned by `simulate()`, called only when `key` is not in `results`."""
+    result = results.get(key)
+    if result is None:
+        result = simulate()
+        results.set(key, result)
+    return result
    
 @route("/", template="mips")
 def mips_ui():
@@ -15,42 +49,226 @@ def mips_ui():
 def execution():
     text = request.POST.get("text")
     data_forwarding = bool(int(request.POST.get("data_forwarding", 0)))
+    delta_history = bool(int(request.POST.get("delta_history", 0)))
+    stream = bool(int(request.POST.get("stream", 0)))
 
     if text:
-        mips = Mips(text, data_forwarding=data_forwarding)
-        mips.run()
-        return {"text":text, "result":mips.history}
+        def simulate():
+            return pool.run(jobs.execute, text, data_forwarding, delta_history, MIPS_MAX_AGE)
+
+        key = result_key(text, route="execute", data_forwarding=data_forwarding,
+                         delta_history=delta_history, life=MIPS_MAX_AGE, memory_size=MEMORY_SIZE)
+        try:
+            if stream:
+                result = results.get(key)
+                if result is None:
+                    return streamed_execution(key, text, data_forwarding, delta_history)
+            else:
+                result = cached_result(key, simulate)
+        except JobTimeout:
+            return {"error":"TIMEOUT"}
+        except PoolBusy:
+            return {"error":"BUSY"}
+        except ValueError:
+            return {"error":"INVALID_TEXT"}
+
+        # the cached history is spliced in as is, not parsed and dumped again
+        response.content_type = "application/x-ndjson" if stream else "application/json"
+        return '{"text": %s, "%s": %s}%s' % (json.dumps(text), "delta" if delta_history else "result",
+                                             result, "\n" if stream else "")
         
     return {"error":"INVALID_TEXT"}
 
+def streamed_execution(key, text, data_forwarding, delta_history):
+    """
+    /execute response with `stream` set: NDJSON lines sent while the
+    simulation runs, each with the next `jobs.CHUNK_SIZE` states as
+    `result` or `delta`, the first one with the `text` too. A last line
+    carries the `error`, if any.
+    """
+    job, chunks = pool.stream(jobs.execute_stream, text, data_forwarding, delta_history,
+                              MIPS_MAX_AGE)
+
+    def lines():
+        prefix = '"text": %s, ' % json.dumps(text)
+        for chunk in chunks:
+            yield '{%s"%s": %s}\n' % (prefix, "delta" if delta_history else "result", chunk)
+            prefix = ""
+        try:
+            results.set(key, job.get())
+        except JobTimeout:
+            yield '{"error": "TIMEOUT"}\n'
+        except ValueError:
+            yield '{"error": "INVALID_TEXT"}\n'
+        except Exception:
+            yield '{"error": "SIMULATION_ERROR"}\n'
+
+    response.content_type = "application/x-ndjson"
+    return lines()
+
+def summary(stats):
+    return {"clocks":stats["clock"],
+            "throughput":stats["throughput"],
+            "cpi":stats["cpi"],
+            "stalls":stats["stalls"]}
+
 @route("/compare", method="POST")
 def execution():
     text = request.POST.get("text")
 
     if text:
-        slower_mips = Mips(text, data_forwarding=False)
-        slower_mips.run()
-        slower_mips_state = slower_mips.current_state()
+        def simulate():
+            # both configurations run at once, each in its own worker
+            stats = [None, None]
+            calls = [(jobs.stats, (text, {"data_forwarding":data_forwarding}, MIPS_MAX_AGE))
+                     for data_forwarding in (False, True)]
+            for job in pool.map_unordered(calls, block=False):
+                stats[job.index] = job.get()
+            slower_mips_stats, faster_mips_stats = stats
 
-        faster_mips = Mips(text, data_forwarding=True)
-        faster_mips.run()
-        faster_mips_state = faster_mips.current_state()
+            return json.dumps({"slower_mips":summary(slower_mips_stats),
+                               "faster_mips":summary(faster_mips_stats)})
 
-        return {"text":text,
-                "slower_mips":{"clocks":slower_mips_state["clock"],
-                               "throughput":slower_mips_state["throughput"]},
-                "faster_mips":{"clocks":faster_mips_state["clock"],
-                               "throughput":faster_mips_state["throughput"]}}
+        key = result_key(text, route="compare", life=MIPS_MAX_AGE, memory_size=MEMORY_SIZE)
+        try:
+            result = json.loads(cached_result(key, simulate))
+        except JobTimeout:
+            return {"error":"TIMEOUT"}
+        except PoolBusy:
+            return {"error":"BUSY"}
+        except ValueError:
+            return {"error":"INVALID_TEXT"}
+        result["text"] = text
+        return result
 
     return {"error":"INVALID_TEXT"}
 
+@route("/configurations", method="POST")
+def configurations():
+    """
+    Headless runs of one program under a JSON list of `configurations`,
+    returned as one row per configuration, in request order.
+    """
+    text = request.POST.get("text")
+    if not text:
+        return {"error":"INVALID_TEXT"}
+
+    try:
+        options = json.loads(request.POST.get("configurations", "[]"))
+        if not isinstance(options, list) or not 0 < len(options) <= MAX_CONFIGURATIONS:
+            raise ValueError("between 1 and %d configurations" % MAX_CONFIGURATIONS)
+        configurations = [jobs.configuration(option) for option in options]
+    except ValueError as e:
+        return {"error":"INVALID_CONFIGURATION", "message":str(e)}
+
+    rows = [{"configuration":configuration} for configuration in configurations]
+    keys = [result_key(text, route="stats", life=MIPS_MAX_AGE, **configuration)
+            for configuration in configurations]
+    missing = []
+    for row, key in zip(rows, keys):
+        result = results.get(key)
+        if result is None:
+            missing.append((row, key))
+        else:
+            row.update(json.loads(result))
+
+    calls = [(jobs.stats, (text, row["configuration"], MIPS_MAX_AGE)) for row, _ in missing]
+    try:
+        # a few slots at a time, leaving the others to interactive requests
+        for job in pool.map_unordered(calls, window=jobs.BATCH_WINDOW):
+            row, key = missing[job.index]
+            try:
+                result = summary(job.get())
+            except JobTimeout:
+                row["error"] = "TIMEOUT"
+            except ValueError:
+                row["error"] = "INVALID_TEXT"
+            except Exception:
+                row["error"] = "SIMULATION_ERROR"
+            else:
+                row.update(result)
+                results.set(key, json.dumps(result))
+    except PoolBusy:
+        return {"error":"BUSY"}
+
+    return {"text":text, "results":rows}
+
+@route("/batch", method="POST")
+def batch():
+    """
+    Headless runs of a JSON list of `programs`, with one optional JSON
+    `configuration` for all of them. Streams one NDJSON line per program,
+    in completion order, carrying its `index` in the list.
+    """
+    try:
+        texts = json.loads(request.POST.get("programs", "[]"))
+        if (not isinstance(texts, list) or not 0 < len(texts) <= MAX_BATCH
+                or not all(isinstance(text, basestring) for text in texts)):
+            raise ValueError("between 1 and %d program texts" % MAX_BATCH)
+        options = jobs.configuration(json.loads(request.POST.get("configuration", "{}")))
+    except ValueError as e:
+        return {"error":"INVALID_BATCH", "message":str(e)}
+
+    def lines():
+        try:
+            for result in jobs.batch(pool, texts, options, MIPS_MAX_AGE):
+                yield "%s\n" % json.dumps(result)
+        except PoolBusy:
+            # programs without a line were never run
+            yield '{"error": "BUSY"}\n'
+
+    response.content_type = "application/x-ndjson"
+    return lines()
+
+@route("/session", method="POST")
+def session_create():
+    text = request.POST.get("text")
+    data_forwarding = bool(int(request.POST.get("data_forwarding", 0)))
+
+    if text:
+        try:
+            program = programs.load(text)
+        except ValueError:
+            return {"error":"INVALID_TEXT"}
+        key, session = sessions.create(program, data_forwarding=data_forwarding)
+        return {"session":key, "state":session.mips.current_state()}
+
+    return {"error":"INVALID_TEXT"}
+
+@route("/session/:key/step", method="POST")
+def session_step(key):
+    try:
+        cycles = int(request.POST.get("cycles", 1))
+    except ValueError:
+        return {"error":"INVALID_CYCLES"}
+
+    try:
+        session = sessions.get(key)
+    except KeyError:
+        return {"error":"INVALID_SESSION"}
+
+    return {"session":key, "result":session.step(cycles), "finished":session.finished}
+
+@route("/session/:key/state/:cycle#[0-9]+#")
+def session_state(key, cycle):
+    try:
+        session = sessions.get(key)
+        return {"session":key, "state":session.state_at(int(cycle))}
+    except KeyError:
+        return {"error":"INVALID_SESSION"}
+    except IndexError:
+        return {"error":"INVALID_CYCLE"}
+
+@route("/session/:key", method="DELETE")
+def session_delete(key):
+    sessions.delete(key)
+    return {"session":key}
+
 @route("/compile", method="POST")
 def compiler():
     text = request.POST.get("text")
     
-    interpreter = Interpreter(text)
-    interpreter.compile()
-    result = str(interpreter)
+    result = "\n".join(programs.assemble(text))
     return {'result':result}
     
 @route("/static/:path#.+#")
@@ -59,7 +277,10 @@ def static_server(path):
     
 def main(debug=False, reloader=False, host="0.0.0.0"):
     bottle.debug(debug)
-    bottle.run(reloader=reloader, host=host)
+    if not reloader or os.environ.get("BOTTLE_CHILD"):
+        # forked before any request thread or results connection exists
+        pool.start()
+    bottle.run(reloader=reloader, host=host, server_class=ThreadingWSGIServer)
 
 if __name__ == "__main__":
     main(debug=True, reloader=True)
@@ -0,0 +1,96 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from mips import Mips, MIPS_MAX_AGE
+
+MAX_SESSIONS = 100
+IDLE_TIMEOUT = 15 * 60
+CHECKPOINT_INTERVAL = 100
+MAX_STEP_CYCLES = 1000 # per step request
+
+
+class Session(object):
+    """
+    A `Mips` stepped by the client. Requests for the same session may run
+    on different threads, so they take turns on `_lock`.
+    """
+
+    def __init__(self, text, data_forwarding=False, life=MIPS_MAX_AGE):
+        self.mips = Mips(text, data_forwarding=data_forwarding,
+                         checkpoint_interval=CHECKPOINT_INTERVAL)
+        self.life = life
+        self.finished = False
+        self.last_access = None
+        self._lock = threading.Lock()
+
+    def step(self, cycles=1):
+        """
+        Execute up to `cycles` cycles, at most `MAX_STEP_CYCLES`, and return
+        the state of each one.
+        """
+        cycles = min(cycles, MAX_STEP_CYCLES)
+        states = []
+        with self._lock:
+            while len(states) < cycles and not self.finished:
+                self.finished = self.mips.step(self.life)
+                states.append(self.mips.current_state())
+        return states
+
+    def state_at(self, cycle):
+        with self._lock:
+            return self.mips.state_at(cycle)
+
+
+class SessionStore(object):
+    """
+    Live `Session`s kept in least recently used order. Creating a session
+    beyond `max_sessions` evicts the oldest one, and sessions idle for more
+    than `idle_timeout` seconds are dropped.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT, clock=time.time):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, text, data_forwarding=False):
+        session = Session(text, data_forwarding=data_forwarding)
+        key = uuid.uuid4().hex
+
+        with self._lock:
+            self._expire()
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            session.last_access = self._clock()
+            self._sessions[key] = session
+        return key, session
+
+    def get(self, key):
+        with self._lock:
+            self._expire()
+            session = self._sessions.pop(key)
+            session.last_access = self._clock()
+            self._sessions[key] = session
+        return session
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def _expire(self):
+        deadline = self._clock() - self.idle_timeout
+        while self._sessions:
+            key, session = next(self._sessions.iteritems())
+            if session.last_access > deadline:
+                break
+            del self._sessions[key]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        return key in self._sessions
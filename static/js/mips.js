@@ -2,8 +2,11 @@ TICKS = 100;
 
 var mips = {
     _data: [],
+    _phases: [],
     _current_position: null,
     _running: false,
+    _streaming: false,
+    _xhr: null,
 
     compare: function(text, data_forwarding) {
         $.ajax({
@@ -27,13 +30,44 @@ var mips = {
 
     execute: function(text, data_forwarding) {
         var bool = (data_forwarding) ? 1 : 0;
-        $.ajax({
-            url: '/execute',
-            data: {"text":text, "data_forwarding":bool},
-            success: mips._execute_callback,
-            dataType: "json",
-            type: "POST"
-        });
+        var xhr = new XMLHttpRequest();
+        var received = 0;
+
+        // every complete NDJSON line is handled as soon as it arrives,
+        // unless a newer execution has replaced this request
+        var read = function() {
+            if (xhr !== mips._xhr) {
+                return;
+            }
+            var lines = xhr.responseText.slice(received).split("\n");
+            var complete = (xhr.readyState == 4) ? lines.length : lines.length - 1;
+            for (var i=0; i < complete; i++) {
+                received += lines[i].length + 1;
+                if (lines[i]) {
+                    mips._execute_callback(JSON.parse(lines[i]));
+                }
+            }
+        };
+
+        if (mips._xhr) {
+            mips._xhr.abort();
+        }
+        mips._xhr = xhr;
+        mips._data = [];
+        mips._phases = [];
+        mips._streaming = true;
+        xhr.onprogress = read;
+        xhr.onload = function() {
+            if (xhr !== mips._xhr) {
+                return;
+            }
+            read();
+            mips._streaming = false;
+            mips._xhr = null;
+        };
+        xhr.open("POST", "/execute");
+        xhr.setRequestHeader("Content-Type", "application/x-www-form-urlencoded");
+        xhr.send($.param({"text":text, "data_forwarding":bool, "delta_history":1, "stream":1}));
     },
 
     next: function() {
@@ -83,7 +117,7 @@ var mips = {
             if (mips._current_position < mips._data.length - 1) {
                 mips.goto(++mips._current_position);
             }
-            else {
+            else if (!mips._streaming) {
                 mips._running = false;
             }
             setTimeout(mips._run, TICKS);
@@ -127,9 +161,55 @@ var mips = {
         bytecode.value = data.result;
     },
     
+    // called with every chunk of a streamed execution, playback starts on the first one
     _execute_callback: function(data) {
-        mips._data = data.result;
-        mips.goto(0);
+        var first = mips._data.length == 0;
+        if (data.delta) {
+            mips._phases = mips._phases.concat(data.delta.phases);
+            mips._data = mips._data.concat(mips._expand_history(data.delta));
+        }
+        else if (data.result) {
+            mips._data = mips._data.concat(data.result);
+        }
+        if (first && mips._data.length > 0) {
+            mips.goto(0);
+        }
+    },
+
+    // states of a delta chunk, following the ones already in `_data`
+    _expand_history: function(delta) {
+        var state = delta.keyframe || mips._data[mips._data.length - 1];
+        var history = delta.keyframe ? [state] : [];
+
+        for (var i=0; i < delta.deltas.length; i++) {
+            var changes = delta.deltas[i];
+            var next = $.extend({}, state);
+            next.registers = state.registers.slice();
+            next.pipeline = state.pipeline.slice();
+
+            for (var key in changes) {
+                if (key == "registers") {
+                    for (var j in changes.registers) {
+                        next.registers[j] = changes.registers[j];
+                    }
+                }
+                else if (key == "pipeline") {
+                    for (var j in changes.pipeline) {
+                        next.pipeline[j] = mips._phases[changes.pipeline[j]];
+                    }
+                }
+                else if (key == "memory") {
+                    next.memory = state.memory.concat(changes.memory).slice(-4);
+                }
+                else {
+                    next[key] = changes[key];
+                }
+            }
+            next.throughput = next.clock > 0 ? next.instructions_completed / next.clock : 0;
+            history.push(next);
+            state = next;
+        }
+        return history;
     },
 
     _set_registers: function(registers) {
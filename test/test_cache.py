@@ -0,0 +1,222 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import instructions
+from cache import ProgramCache, ResultCache, result_key, source_hash, SUFFIX
+from mips import Mips
+from program import Program
+
+SOURCE = """addi R1,R0,3
+            addi R2,R0,2
+            beq R1,R2,EQ
+            jmp END
+            EQ:
+            addi R1,R0,5
+            END:"""
+
+BYTECODE = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+              00100000000000100000000000000010 ; I2: addi R2,R0,2
+              00010100001000100000000000001000 ; I3: beq R1,R2,8
+              00001000000000000000000000010100 ; I4: jmp 20
+              00100000000000010000000000000101 ; I5: addi R1,R0,5"""
+
+
+class TestProgramCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ProgramCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SUFFIX))
+
+    def test_assemble(self):
+        program = self.cache.assemble(SOURCE)
+        self.assertEqual(list(program), [line.strip() for line in BYTECODE.split("\n")])
+        self.assertEqual(self.entries(), [source_hash("assembly", SOURCE) + SUFFIX])
+
+    def test_hit_skips_assembler(self):
+        self.cache.set(source_hash("assembly", SOURCE), Program([0], ["I1: nop"]))
+        self.assertEqual(list(self.cache.assemble(SOURCE)),
+                         ["00000000000000000000000000000000 ; I1: nop"])
+
+    def test_hit_skips_decoding(self):
+        expected = self.cache.load(BYTECODE).decode()
+
+        def decode(*args):
+            raise AssertionError("decoded on a cache hit")
+        original = instructions.Instruction.__dict__["decode"]
+        instructions.Instruction.decode = staticmethod(decode)
+        try:
+            program = ProgramCache(self.directory).load(BYTECODE)
+        finally:
+            instructions.Instruction.decode = original
+        self.assertEqual(program.decode(), expected)
+
+    def test_unknown_instruction_class(self):
+        key = source_hash("bytecode", BYTECODE)
+        path = os.path.join(self.directory, key + SUFFIX)
+        self.cache.load(BYTECODE)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data.replace("AddiInstruction", "Popen__________"))
+        self.assertEqual(self.cache.get(key), None)
+        self.assertEqual(self.entries(), [])
+
+    def test_normalized_source(self):
+        indented = "\n\n".join("    %s  " % line.strip() for line in SOURCE.split("\n"))
+        self.assertEqual(source_hash("assembly", indented), source_hash("assembly", SOURCE))
+        self.assertNotEqual(source_hash("bytecode", SOURCE), source_hash("assembly", SOURCE))
+
+    def test_load(self):
+        expected = Mips(BYTECODE)
+        expected.run()
+        for _ in range(2):
+            mips = Mips(self.cache.load(BYTECODE))
+            mips.run()
+            self.assertEqual(mips.history, expected.history)
+
+    def test_corrupted_entry(self):
+        key = source_hash("bytecode", BYTECODE)
+        with open(os.path.join(self.directory, key + SUFFIX), "wb") as f:
+            f.write("garbage")
+        self.assertEqual(self.cache.get(key), None)
+        self.assertEqual(self.entries(), [])
+        self.assertEqual(len(self.cache.load(BYTECODE)), 5)
+
+    def test_eviction(self):
+        self.cache.set("old", Program([0] * 25))
+        os.utime(os.path.join(self.directory, "old" + SUFFIX), (0, 0))
+        self.cache.set("new", Program([0] * 25))
+        size = os.path.getsize(os.path.join(self.directory, "new" + SUFFIX))
+
+        self.cache.max_bytes = 5 * size // 2
+        self.cache.set("newest", Program([0] * 2))
+        self.assertEqual(self.entries(), ["new" + SUFFIX, "newest" + SUFFIX])
+        self.assertEqual(self.cache.get("old"), None)
+        self.assertEqual(list(self.cache.get("newest")), ["0" * 32] * 2)
+
+    def test_eviction_low_water(self):
+        self.cache.set("first", Program([0] * 25))
+        size = os.path.getsize(os.path.join(self.directory, "first" + SUFFIX))
+        self.assertEqual(self.cache.size, size)
+        self.assertEqual(ProgramCache(self.directory).size, size)
+
+        self.cache.max_bytes = 4 * size
+        listdir = os.listdir
+        os.listdir = None
+        try:
+            for index in range(2, 5):
+                self.cache.set("first", Program([0] * 25))
+                self.cache.set(str(index), Program([0] * 25))
+        finally:
+            os.listdir = listdir
+        self.assertEqual(self.cache.size, 4 * size)
+        self.assertEqual(len(self.entries()), 4)
+
+        for index in range(4):
+            os.utime(os.path.join(self.directory, self.entries()[index]), (index, index))
+        self.cache.set("5", Program([0] * 25))
+        self.assertEqual(self.entries(), ["4" + SUFFIX, "5" + SUFFIX, "first" + SUFFIX])
+        self.assertEqual(self.cache.size, 3 * size)
+
+    def test_private_directory(self):
+        self.assertEqual(os.stat(self.directory).st_mode & 0777, 0700)
+        os.chmod(self.directory, 0777)
+        self.assertRaises(ValueError, ProgramCache, self.directory)
+        os.chmod(self.directory, 0700)
+        os.symlink(self.directory, os.path.join(self.directory, "link"))
+        self.assertRaises(ValueError, ProgramCache, os.path.join(self.directory, "link"))
+        cache = ProgramCache(os.path.join(self.directory, "new"))
+        self.assertEqual(os.stat(cache.directory).st_mode & 0777, 0700)
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "results.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_result_key(self):
+        key = result_key(BYTECODE, route="execute", data_forwarding=False)
+        self.assertEqual(key, result_key("\n" + BYTECODE.replace("  ", ""),
+                                         data_forwarding=False, route="execute"))
+        self.assertNotEqual(key, result_key(BYTECODE, route="execute", data_forwarding=True))
+        self.assertNotEqual(key, result_key(BYTECODE, route="compare", data_forwarding=False))
+
+    def test_get_and_set(self):
+        results = ResultCache()
+        self.assertEqual(results.get("a"), None)
+        results.set("a", "[1, 2]")
+        self.assertEqual(results.get("a"), "[1, 2]")
+        results.set("a", "[3]")
+        self.assertEqual(results.get("a"), "[3]")
+        self.assertEqual(results.size, 3)
+
+    def test_lru_budget(self):
+        results = ResultCache(max_bytes=10)
+        results.set("a", "x" * 4)
+        results.set("b", "x" * 4)
+        results.get("a")
+        results.set("c", "x" * 4)
+        self.assertTrue("a" in results)
+        self.assertFalse("b" in results)
+        self.assertTrue("c" in results)
+        self.assertEqual(results.size, 8)
+
+    def test_too_large(self):
+        results = ResultCache(max_bytes=10)
+        results.set("a", "x" * 11)
+        self.assertEqual(len(results), 0)
+
+    def test_persistence(self):
+        results = ResultCache(filename=self.filename)
+        results.set("a", "[1]")
+        results.close()
+
+        results = ResultCache(filename=self.filename)
+        self.assertFalse("a" in results)
+        self.assertEqual(results.get("a"), "[1]")
+        self.assertTrue("a" in results)
+        results.close()
+
+    def test_persistence_budget(self):
+        now = [0]
+        results = ResultCache(max_bytes=10, filename=self.filename, clock=lambda: now[0])
+        for key in "abc":
+            now[0] += 1
+            results.set(key, "x" * 4)
+        results.close()
+
+        results = ResultCache(max_bytes=10, filename=self.filename)
+        self.assertEqual(results.get("a"), None)
+        self.assertEqual(results.get("b"), "x" * 4)
+        results.close()
+
+    def test_persistence_memory_hits(self):
+        now = [0]
+        results = ResultCache(max_bytes=10, filename=self.filename, clock=lambda: now[0])
+        for key in "ab":
+            now[0] += 1
+            results.set(key, "x" * 4)
+        now[0] += 1
+        results.get("a")
+        now[0] += 1
+        results.set("c", "x" * 4)
+        results.close()
+
+        results = ResultCache(max_bytes=10, filename=self.filename)
+        self.assertEqual(results.get("a"), "x" * 4)
+        self.assertEqual(results.get("b"), None)
+        results.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from mips import Mips
+from functional import FunctionalMips, compile_program
+
+PROJECT_EXAMPLE = """00100000000010100000000001100100 ; I1: addi R10,R0,100
+                     10101100000000000000000000011000 ; I2: sw R0,24(R0)
+                     10101100000000000000000000011100 ; I3: sw R0,28(R0)
+                     10001100000001100000000000011100 ; I4: lw R6,28(R0)
+                     00000000110001100011100000011000 ; I5: mul R7,R6,R6
+                     10001100000000010000000000011000 ; I6: lw R1,24(R0)
+                     00000000001001110100100000100000 ; I7: add R9,R1,R7
+                     10101100000010010000000000011000 ; I8: sw R9,24(R0)
+                     00100000110001100000000000000001 ; I9: addi R6,R6,1
+                     10101100000001100000000000011100 ; I10: sw R6,28(R0)
+                     00011100110010100000000000001100 ; I11: ble R6,R10,12"""
+
+BRANCHES = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+              00100000000000100000000000000010 ; I2: addi R2,R0,2
+              00010100001000100000000000001000 ; I3: beq R1,R2,8
+              00001000000000000000000000011000 ; I4: jmp 24
+              00100000000000010000000000000101 ; I5: addi R1,R0,5
+              00001000000000000000000000011100 ; I6: jmp 28
+              00100000000000010000000000000111 ; I7: addi R1,R0,7
+              00010000001000100000000000000000 ; I8: bne R1,R2,0
+              00000000001000100001100000100010 ; I9: sub R3,R1,R2
+              00000000000000000000000000000000 ; I10: nop"""
+
+SUM = """00100000000000000000000000100000 ; I1: addi R0,R0,32
+         00100000011000100000010000000000 ; I2: addi R2,R3,1024
+         00000000001000000000100000100000 ; I3: add R1,R1,R0
+         00011100001000100000000000001000 ; I4: ble R1,R2,8
+         10101100011000010000000000000000 ; I5: sw R1,0(R3)"""
+
+
+class TestFunctionalMips(unittest.TestCase):
+    def assertSameResult(self, text):
+        mips = Mips(text)
+        mips.run(record_history=False)
+        functional = FunctionalMips(text)
+        functional.run()
+
+        self.assertEqual(functional.registers.current_state(), mips.registers.current_state())
+        self.assertEqual(functional.memory._array, mips.memory._array)
+        self.assertEqual(functional.memory.history, mips.memory.history)
+        self.assertEqual(functional.instructions_completed, mips.instructions_completed)
+
+    def test_project_example(self):
+        self.assertSameResult(PROJECT_EXAMPLE)
+
+    def test_branches(self):
+        self.assertSameResult(BRANCHES)
+
+    def test_sum(self):
+        self.assertSameResult(SUM)
+
+    def test_overflow_wraps(self):
+        text = """00100000000000010111111111111111 ; I1: addi R1,R0,32767
+                  00000000001000010001000000011000 ; I2: mul R2,R1,R1
+                  00000000010000100001000000011000 ; I3: mul R2,R2,R2
+                  00000000010000010001100000100000 ; I4: add R3,R2,R1"""
+        self.assertSameResult(text)
+        functional = FunctionalMips(text)
+        functional.run()
+        self.assertEqual(functional.registers[2], ((32767 ** 4 + 2 ** 31) % 2 ** 32) - 2 ** 31)
+
+    def test_max_instructions(self):
+        functional = FunctionalMips(PROJECT_EXAMPLE)
+        self.assertEqual(functional.run(max_instructions=5), 5)
+        self.assertEqual(functional.pc, 20)
+        self.assertEqual(functional.registers[7], 0)
+        functional.run()
+        self.assertEqual(functional.memory[24], 338350)
+
+    def test_empty_program(self):
+        self.assertEqual(FunctionalMips().run(), 0)
+
+
+class TestCompileProgram(unittest.TestCase):
+    def setUp(self):
+        self.mips = Mips(BRANCHES)
+        self.ops = compile_program(self.mips.decoded_instructions)
+        self.registers = [0] * 32
+
+    def test_one_op_per_instruction(self):
+        self.assertEqual(len(self.ops), 10)
+
+    def test_addi(self):
+        self.assertEqual(self.ops[0](self.registers, None), 4)
+        self.assertEqual(self.registers[1], 3)
+
+    def test_beq_not_taken(self):
+        self.registers[1] = 1
+        self.assertEqual(self.ops[2](self.registers, None), 12)
+
+    def test_beq_taken(self):
+        self.assertEqual(self.ops[2](self.registers, None), 16)
+
+    def test_jmp(self):
+        self.assertEqual(self.ops[3](self.registers, None), 24)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import unittest
+
+from mips import Mips
+from history import DeltaHistory
+
+TEXT = """00100000000010100000000000001010 ; I1: addi R10,R0,10
+          10101100000000000000000000011000 ; I2: sw R0,24(R0)
+          10101100000000000000000000011100 ; I3: sw R0,28(R0)
+          10001100000001100000000000011100 ; I4: lw R6,28(R0)
+          00000000110001100011100000011000 ; I5: mul R7,R6,R6
+          10001100000000010000000000011000 ; I6: lw R1,24(R0)
+          00000000001001110100100000100000 ; I7: add R9,R1,R7
+          10101100000010010000000000011000 ; I8: sw R9,24(R0)
+          00100000110001100000000000000001 ; I9: addi R6,R6,1
+          10101100000001100000000000011100 ; I10: sw R6,28(R0)
+          00011100110010100000000000001100 ; I11: ble R6,R10,12"""
+
+
+class TestDeltaHistory(unittest.TestCase):
+    def setUp(self):
+        self.full = Mips(TEXT)
+        self.full.run()
+        self.delta = Mips(TEXT, delta_history=True)
+        self.delta.run()
+
+    def test_same_length(self):
+        self.assertEqual(len(self.delta.history), len(self.full.history))
+
+    def test_rebuild_cycle(self):
+        for cycle in range(0, len(self.full.history), 25):
+            self.assertEqual(self.delta.history[cycle], self.full.history[cycle])
+
+    def test_iterate(self):
+        self.assertEqual(list(self.delta.history), self.full.history)
+
+    def test_negative_index(self):
+        self.assertEqual(self.delta.history[-1], self.full.history[-1])
+
+    def test_out_of_range(self):
+        self.assertRaises(IndexError, self.delta.history.__getitem__, len(self.full.history))
+
+    def test_delta_only_keeps_changes(self):
+        for delta in self.delta.history.deltas:
+            self.assertTrue(len(delta.get("registers", {})) <= 2)
+            self.assertTrue(len(delta.get("memory", [])) <= 1)
+            self.assertFalse("throughput" in delta)
+
+    def test_serialized_is_smaller(self):
+        full = len(json.dumps(self.full.history))
+        delta = len(json.dumps(self.delta.history.serialize()))
+        self.assertTrue(delta * 10 < full)
+
+
+class TestEmptyDeltaHistory(unittest.TestCase):
+    def test_empty(self):
+        history = DeltaHistory()
+        self.assertEqual(len(history), 0)
+        self.assertEqual(list(history), [])
+        self.assertRaises(IndexError, history.__getitem__, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -109,6 +109,52 @@ class TestInstructionInvalid(unittest.TestCase):
         self.assertRaises(KeyError, Instruction, text)
 
 
+class TestInstructionTemplate(unittest.TestCase):
+    def setUp(self):
+        self.text = "00100000000010100000000001100100 ; I1: addi R10,R0,100"
+        self.template = Instruction.decode(self.text)
+
+    def test_decode(self):
+        self.assertEqual(self.template.instruction_class, instructions.AddiInstruction)
+
+    def test_instance_from_template(self):
+        instruction = self.template()
+        self.assertEqual(type(instruction), instructions.AddiInstruction)
+        self.assertEqual(instruction.rt, 10)
+        self.assertEqual(instruction.immediate, 100)
+        self.assertEqual(instruction.text, "I1: addi R10,R0,100")
+
+    def test_instances_are_independent(self):
+        first = self.template()
+        second = self.template()
+        first.rs_value = 3
+        self.assertFalse(first is second)
+        self.assertFalse(hasattr(second, "rs_value"))
+        first._to_lock = (3,)
+        self.assertEqual(second._to_lock, ())
+
+    def test_invalid_opcode(self):
+        self.assertRaises(KeyError, Instruction.decode, "11111100000000000000000000101010")
+
+
+class TestCompactInstruction(unittest.TestCase):
+    def setUp(self):
+        self.instruction = Instruction("00000000001001110100100000100000 ; I7: add R9,R1,R7")
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.instruction, "__dict__"))
+
+    def test_flags_shared_by_class(self):
+        other = Instruction("00000000000000010001000000100000 ; I1: add R2,R0,R1")
+        self.assertTrue(self.instruction.flags is other.flags)
+        self.assertEqual(self.instruction.flags[instructions.REG_DST], 1)
+
+    def test_current_state_copies_flags(self):
+        state = self.instruction.current_state()
+        state["flags"][instructions.REG_DST] = 0
+        self.assertEqual(self.instruction.flags[instructions.REG_DST], 1)
+
+
 class BaseTestInstruction(object):
     def instruction_decode(self):
         self.instruction.instruction_decode(self._mips)
@@ -1,6 +1,8 @@
+import tempfile
 import unittest
 
 from interpreter import Interpreter
+from program import Program
 
 class TestCompile(unittest.TestCase):
 
@@ -91,6 +93,15 @@ class TestCompile(unittest.TestCase):
         self.assertEqual(len(interpreter.instructions), 1)
         self.assertEqual(interpreter.instructions[0], "00000000001001110100100000100010 ; I1: sub R9,R1,R7")
     
+    def test_words(self):
+        code = """addi R6,R5,1
+                  LOOP:
+                  beq R1,R2,LOOP"""
+        interpreter = Interpreter(code)
+        interpreter.compile()
+        self.assertEqual(interpreter.words, [0x20a60001, 0x14220000])
+        self.assertEqual(interpreter.texts, ["addi R6,R5,1", "beq R1,R2,0"])
+
     def test_sw(self):
         code = "sw R1,24(R0)"
         interpreter = Interpreter(code)
@@ -184,6 +195,51 @@ class TestInterpreter(unittest.TestCase):
             self.assertEqual(compiled, correct)
         
     
+class TestAssemble(unittest.TestCase):
+    example = """addi R1,R0,3
+                 addi R2,R0,2
+                 beq R1,R2,EQ
+                 jmp NE
+                 EQ:
+                 addi R1,R0,5
+                 jmp END
+                 NE:
+                 addi R1,R0,7
+                 LOOP:
+                 ble R1,R2,LOOP
+                 END:"""
+
+    def assemble(self, lines, texts=True):
+        output = tempfile.TemporaryFile()
+        count = Interpreter().assemble(lines, output, texts)
+        output.seek(0)
+        return count, output.read()
+
+    def test_same_as_compile(self):
+        interpreter = Interpreter(self.example)
+        interpreter.compile()
+        count, data = self.assemble(self.example.split("\n"))
+        self.assertEqual(count, 8)
+        self.assertEqual(data, interpreter.program().to_bytes())
+
+    def test_from_file(self):
+        source = tempfile.TemporaryFile()
+        source.write(self.example)
+        source.seek(0)
+        count, data = self.assemble(source)
+        self.assertEqual(list(Program.from_buffer(data))[3],
+                         "00001000000000000000000000011000 ; I4: jmp 24")
+
+    def test_without_texts(self):
+        count, data = self.assemble(self.example.split("\n"), texts=False)
+        program = Program.from_buffer(data)
+        self.assertEqual(program.texts, [])
+        self.assertEqual(program[2], "00010100001000100000000000001000")
+
+    def test_undefined_label(self):
+        self.assertRaises(KeyError, self.assemble, ["nop", "jmp NOWHERE"])
+
+
 class TestBinaryOperations(unittest.TestCase):
     def setUp(self):
         self.interpreter = Interpreter()
@@ -195,6 +251,8 @@ class TestBinaryOperations(unittest.TestCase):
         self.assertEqual(self.interpreter._to_bin(-4, 5), '11100')
         self.assertEqual(self.interpreter._to_bin(-7, 5), '11001')
         self.assertEqual(self.interpreter._to_bin(-8, 5), '11000')
-        self.assertEqual(self.interpreter._to_bin(12, 5), '01100')        
+        self.assertEqual(self.interpreter._to_bin(12, 5), '01100')
+        self.assertEqual(self.interpreter._to_bin(-2), '110')
+        self.assertEqual(self.interpreter._to_bin(-8), '11000')        
     
 
@@ -0,0 +1,179 @@
+import json
+import time
+import unittest
+
+import jobs
+from jobs import SimulationPool, JobTimeout, PoolBusy
+from mips import Mips, MIPS_MAX_AGE
+
+PROGRAM = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+             00100000000000100000000000000010 ; I2: addi R2,R0,2
+             00000000001000100001100000100010 ; I3: sub R3,R1,R2"""
+
+FOREVER = "00001000000000000000000000000000 ; I1: jmp 0"
+
+
+class TestRun(unittest.TestCase):
+    def test_run(self):
+        mips = Mips(PROGRAM)
+        jobs.run(mips, MIPS_MAX_AGE, time.time() + 60)
+        expected = Mips(PROGRAM)
+        expected.run()
+        self.assertEqual(mips.history, expected.history)
+
+    def test_cycle_budget(self):
+        mips = Mips(FOREVER)
+        stats = jobs.run(mips, 1000, time.time() + 60, record_history=False)
+        self.assertEqual(stats["clock"], 1001)
+
+    def test_deadline(self):
+        mips = Mips(FOREVER)
+        self.assertRaises(JobTimeout, jobs.run, mips, 10 ** 9, time.time() - 1, False)
+        self.assertEqual(mips.clock, jobs.CHECK_INTERVAL)
+
+
+class TestConfiguration(unittest.TestCase):
+    def test_defaults(self):
+        self.assertEqual(jobs.configuration({}), jobs.CONFIGURATION)
+        self.assertEqual(jobs.configuration({"data_forwarding":1, "mul_latency":4})["mul_latency"], 4)
+        self.assertTrue(jobs.configuration({"data_forwarding":1})["data_forwarding"] is True)
+
+    def test_invalid(self):
+        for options in ([], {"cache":True}, {"mul_latency":0}, {"mul_latency":"2"},
+                        {"memory_size":True}, {"branch_policy":"taken"}, {"data_forwarding":2}):
+            self.assertRaises(ValueError, jobs.configuration, options)
+
+    def test_stats(self):
+        options = {"mul_latency":1, "branch_policy":"stall", "memory_size":8}
+        stats = jobs.stats(PROGRAM, options, MIPS_MAX_AGE, time.time() + 60)
+        expected = Mips(PROGRAM, mul_latency=1, branch_policy="stall").run(record_history=False)
+        self.assertEqual(stats, expected)
+        self.assertRaises(IndexError, jobs.stats, "10101100000000010000000000011000 ; I1: sw R1,24(R0)",
+                          options, MIPS_MAX_AGE, time.time() + 60)
+
+    def test_final_state(self):
+        text = PROGRAM + "\n10101100000000010000000000011000 ; I4: sw R1,24(R0)"
+        result = jobs.final_state(text, {"memory_size":1 << 20}, MIPS_MAX_AGE, time.time() + 60)
+        self.assertEqual(result["memory"], [[24, 3]])
+        self.assertEqual(result["registers"][1:4], [3, 2, 1])
+
+
+class TestJob(unittest.TestCase):
+    def test_expired_job_frees_its_slot(self):
+        released = []
+        job = jobs.Job(0, time.time() - jobs.GRACE, lambda: released.append(True))
+        self.assertRaises(JobTimeout, job.get)
+        job._free()
+        self.assertEqual(released, [True])
+
+
+class TestSimulationPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = SimulationPool(processes=1, wall_clock=5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_stats(self):
+        stats = self.pool.run(jobs.stats, PROGRAM, {"data_forwarding":True}, MIPS_MAX_AGE)
+        self.assertEqual(stats, Mips(PROGRAM, data_forwarding=True).run(record_history=False))
+
+    def test_execute(self):
+        mips = Mips(PROGRAM)
+        mips.run()
+        result = self.pool.run(jobs.execute, PROGRAM, False, False, MIPS_MAX_AGE)
+        self.assertEqual(json.loads(result), json.loads(json.dumps(mips.history)))
+
+    def test_timeout(self):
+        self.assertRaises(JobTimeout, self.pool.run, jobs.stats, FOREVER, {}, 10 ** 9,
+                          wall_clock=0.2)
+        # the worker gave the job up and is free again
+        self.assertEqual(self.pool.run(jobs.stats, PROGRAM, {}, MIPS_MAX_AGE)["clock"], 11)
+
+    def test_stream(self):
+        mips = Mips(FOREVER)
+        mips.run(life=200)
+        job, chunks = self.pool.stream(jobs.execute_stream, FOREVER, False, False, 200)
+        chunks = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual([len(chunk) for chunk in chunks], [64, 64, 64, 10])
+        expected = json.loads(json.dumps(mips.history))
+        self.assertEqual(sum(chunks, []), expected)
+        self.assertEqual(json.loads(job.get()), expected)
+
+    def test_stream_delta(self):
+        mips = Mips(FOREVER, delta_history=True)
+        mips.run(life=200)
+        job, chunks = self.pool.stream(jobs.execute_stream, FOREVER, False, True, 200)
+        chunks = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual([sorted(chunk) for chunk in chunks],
+                         [["deltas", "keyframe", "phases"]] + [["deltas", "phases"]] * 3)
+        expected = json.loads(json.dumps(mips.history.serialize()))
+        self.assertEqual(chunks[0]["keyframe"], expected["keyframe"])
+        self.assertEqual(sum((chunk["deltas"] for chunk in chunks), []), expected["deltas"])
+        self.assertEqual(sum((chunk["phases"] for chunk in chunks), []), expected["phases"])
+
+    def test_stream_timeout(self):
+        job, chunks = self.pool.stream(jobs.execute_stream, FOREVER, False, True, 10 ** 9,
+                                       wall_clock=0.2)
+        self.assertTrue(len(list(chunks)) > 0)
+        self.assertRaises(JobTimeout, job.get)
+
+    def test_map_unordered(self):
+        calls = [(jobs.stats, (FOREVER, {}, 30000)),
+                 (jobs.stats, (PROGRAM, {}, MIPS_MAX_AGE)),
+                 (jobs.stats, (PROGRAM, {"data_forwarding":True}, MIPS_MAX_AGE))]
+        pool = SimulationPool(processes=2, max_pending=2)
+        finished = [(job.index, job.get()["clock"]) for job in pool.map_unordered(calls)]
+        pool.close()
+        self.assertEqual(sorted(finished), [(0, 30001), (1, 11), (2, 9)])
+        self.assertEqual(finished[-1], (0, 30001))
+
+    def test_map_unordered_errors(self):
+        calls = [(jobs.stats, ("invalid", {}, MIPS_MAX_AGE)),
+                 (jobs.stats, (FOREVER, {}, 10 ** 9))]
+        finished = list(self.pool.map_unordered(calls, wall_clock=0.2))
+        self.assertEqual(sorted(job.index for job in finished), [0, 1])
+        for job in finished:
+            self.assertRaises(Exception, job.get)
+        self.assertRaises(JobTimeout, finished[1].get)
+
+    def test_batch(self):
+        texts = iter([PROGRAM, "invalid", FOREVER, PROGRAM])
+        results = dict((result["index"], result) for result in
+                       jobs.batch(self.pool, texts, {"data_forwarding":True}, 10 ** 9,
+                                  wall_clock=0.2))
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        self.assertEqual(results[1], {"index":1, "error":"INVALID_TEXT"})
+        self.assertEqual(results[2], {"index":2, "error":"TIMEOUT"})
+
+        mips = Mips(PROGRAM, data_forwarding=True)
+        mips.run(record_history=False)
+        self.assertEqual(results[0]["stats"], mips.stats())
+        self.assertEqual(results[0]["registers"], mips.registers.current_state())
+        self.assertEqual(results[0]["memory"], [])
+        self.assertEqual(results[3], dict(results[0], index=3))
+
+    def test_batch_window(self):
+        pool = SimulationPool(processes=1, max_pending=2)
+        for result in jobs.batch(pool, [PROGRAM] * 4, window=1):
+            # the batch never holds the second slot
+            self.assertEqual(pool.run(jobs.stats, PROGRAM, {}, MIPS_MAX_AGE)["clock"], 11)
+        pool.close()
+
+    def test_blocking_timeout(self):
+        pool = SimulationPool(processes=1, max_pending=0)
+        started = time.time()
+        self.assertRaises(PoolBusy, pool.run, jobs.stats, PROGRAM, {}, MIPS_MAX_AGE,
+                          block=True, timeout=0.1)
+        self.assertTrue(time.time() - started >= 0.1)
+        pool.close()
+
+    def test_busy(self):
+        pool = SimulationPool(processes=1, max_pending=0)
+        self.assertRaises(PoolBusy, pool.run, jobs.stats, PROGRAM, {}, MIPS_MAX_AGE)
+        pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,10 @@
+import os
+import shutil
+import struct
+import tempfile
 import unittest
 
-from memory import Memory
+from memory import Memory, PagedMemory, MappedMemory, PAGE_SIZE
 
 
 class TestMemory(unittest.TestCase):
@@ -37,3 +41,167 @@ class TestMemory(unittest.TestCase):
         
     def test_access_out_of_memory(self):
         self.assertRaises(IndexError, self.memory.__getitem__, 100)
+
+    def test_history_window(self):
+        memory = Memory(size=64, history_window=3)
+        for i in range(10):
+            memory[i] = i
+        self.assertEqual(list(memory.history), [('sw', 7, 7), ('sw', 8, 8), ('sw', 9, 9)])
+
+    def test_recent(self):
+        for i in range(10):
+            self.memory[i] = i
+        self.assertEqual(self.memory.recent(2), [('sw', 8, 8), ('sw', 9, 9)])
+        self.assertEqual(Memory(size=4).recent(4), [])
+
+    def test_sink(self):
+        log = []
+        memory = Memory(size=64, history_window=2, sink=log.append)
+        for i in range(5):
+            memory[i] = i
+        _ = memory[0]
+        self.assertEqual(len(log), 6)
+        self.assertEqual(log[0], ('sw', 0, 0))
+        self.assertEqual(list(memory.history), [('sw', 4, 4), ('lw', 0, 0)])
+
+    def test_wraparound(self):
+        self.memory[1] = 2 ** 31 + 1
+        self.assertEqual(self.memory[1], -2 ** 31 + 1)
+        self.assertEqual(self.memory.history[0], ('sw', 1, -2 ** 31 + 1))
+
+    def test_snapshot_and_restore(self):
+        self.memory[3] = 7
+        snapshot = self.memory.snapshot()
+        self.memory[3] = 8
+        self.memory.restore(snapshot)
+        self.assertEqual(self.memory[3], 7)
+
+    def test_view(self):
+        self.memory[0] = 1
+        view = self.memory.view()
+        self.assertEqual(len(view), 64 * 4)
+
+    def test_large_memory(self):
+        memory = Memory(size=1 << 20)
+        memory[(1 << 20) - 1] = 42
+        self.assertEqual(memory[(1 << 20) - 1], 42)
+        self.assertEqual(len(memory.view()), 4 << 20)
+
+
+class TestPagedMemory(unittest.TestCase):
+    def setUp(self):
+        self.memory = PagedMemory()
+
+    def test_not_assigned_position(self):
+        self.assertEqual(self.memory[123456789], 0)
+        self.assertEqual(self.memory.touched_pages(), [])
+
+    def test_scattered_accesses(self):
+        self.memory[3] = 1
+        self.memory[(1 << 30) - 1] = 2
+        self.assertEqual(self.memory[3], 1)
+        self.assertEqual(self.memory[(1 << 30) - 1], 2)
+        self.assertEqual(self.memory.touched_pages(), [0, ((1 << 30) - 1) // PAGE_SIZE])
+
+    def test_history(self):
+        self.memory[2] = 3
+        _ = self.memory[5]
+        self.assertEqual(list(self.memory.history), [('sw', 2, 3), ('lw', 5, 0)])
+
+    def test_wraparound(self):
+        self.memory[0] = 2 ** 32 + 1
+        self.assertEqual(self.memory[0], 1)
+
+    def test_access_out_of_memory(self):
+        self.assertRaises(IndexError, self.memory.__getitem__, 1 << 30)
+        self.assertRaises(IndexError, self.memory.__setitem__, -1, 0)
+
+    def test_snapshot_copies_dirty_pages_only(self):
+        self.memory[0] = 1
+        self.memory[PAGE_SIZE] = 2
+        first = self.memory.snapshot()
+        self.memory[PAGE_SIZE + 1] = 3
+        second = self.memory.snapshot()
+        self.assertTrue(first[0] is second[0])
+        self.assertFalse(first[1] is second[1])
+
+    def test_restore(self):
+        self.memory[0] = 1
+        snapshot = self.memory.snapshot()
+        self.memory[0] = 2
+        self.memory[PAGE_SIZE] = 3
+        self.memory.restore(snapshot)
+        self.assertEqual(self.memory[0], 1)
+        self.assertEqual(self.memory[PAGE_SIZE], 0)
+        self.memory[0] = 4
+        self.assertEqual(snapshot[0][0], 1)
+
+
+class TestMemoryImages(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "memory.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, byteorder, values):
+        prefix = {"little":"<", "big":">"}[byteorder]
+        with open(self.filename, "wb") as image:
+            image.write(struct.pack(prefix + "%di" % len(values), *values))
+
+    def test_load_little_endian(self):
+        self._write("little", [1, -2, 3])
+        memory = Memory.load_image(self.filename)
+        self.assertEqual(memory.size, 3)
+        self.assertEqual([memory[i] for i in range(3)], [1, -2, 3])
+
+    def test_load_big_endian_with_size(self):
+        self._write("big", [1, -2, 3])
+        memory = Memory.load_image(self.filename, byteorder="big", size=10)
+        self.assertEqual([memory[i] for i in range(4)], [1, -2, 3, 0])
+
+    def test_dump_and_load(self):
+        for byteorder in ("little", "big"):
+            memory = Memory(size=8)
+            memory[2] = -7
+            memory.dump_image(self.filename, byteorder=byteorder)
+            self.assertEqual(os.path.getsize(self.filename), 32)
+            self.assertEqual(Memory.load_image(self.filename, byteorder=byteorder)[2], -7)
+
+    def test_mapped_memory(self):
+        self._write("big", [5, 6])
+        with MappedMemory(self.filename, byteorder="big") as memory:
+            self.assertEqual(memory.size, 2)
+            self.assertEqual(memory[1], 6)
+            memory[0] = 2 ** 31
+            self.assertEqual(list(memory.history), [('lw', 1, 6), ('sw', 0, -2 ** 31)])
+            self.assertRaises(IndexError, memory.__getitem__, 2)
+        with open(self.filename, "rb") as image:
+            self.assertEqual(struct.unpack(">2i", image.read()), (-2 ** 31, 6))
+
+    def test_mapped_memory_grows_file(self):
+        open(self.filename, "wb").close()
+        with MappedMemory(self.filename, size=16) as memory:
+            memory[15] = 1
+        self.assertEqual(os.path.getsize(self.filename), 64)
+
+    def test_mapped_memory_snapshot(self):
+        self._write("big", [5, 6])
+        with MappedMemory(self.filename, byteorder="big") as memory:
+            snapshot = memory.snapshot()
+            memory[0] = 1
+            memory.restore(snapshot)
+            self.assertEqual(memory[0], 5)
+            blank = memory.blank()
+            blank.restore(snapshot)
+            self.assertEqual(blank[1], 6)
+
+            memory[1] = 7
+            self.assertEqual(memory.snapshot(), {0:5, 1:7})
+            blank = memory.blank()
+            self.assertEqual((blank[0], blank[1]), (5, 6))
+            blank[0] = 9
+            blank.close()
+        with open(self.filename, "rb") as image:
+            self.assertEqual(struct.unpack(">2i", image.read()), (5, 7))
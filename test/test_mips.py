@@ -1,9 +1,14 @@
+import gc
+import os
+import resource
+import tempfile
 import unittest
 
-from mips import Mips
+from mips import Mips, BRANCH_STALL
+from memory import Memory, PagedMemory, MappedMemory
 import instructions
 from instructions import (Instruction, AddInstruction, AddiInstruction,
-                          BeqInstruction, MulInstruction, NopInstruction)
+                          BeqInstruction, MulInstruction, NopInstruction, STALL)
 
 class TestOneInstructionOnMips(unittest.TestCase):
     def _exec_pipeline(self, times):
@@ -76,6 +81,10 @@ class TestMips(unittest.TestCase):
         self.mips.execute_pipeline()
         self.assertTrue(isinstance(self.mips.pipeline[0].instruction, AddInstruction))
         
+    def test_instructions_decoded_once(self):
+        self.assertEqual(len(self.mips.decoded_instructions), 3)
+        self.assertEqual(self.mips.decoded_instructions[1].instruction_class, MulInstruction)
+
     def test_mul_blocking(self):
         self.mips.execute_pipeline()
         self.mips.execute_pipeline()
@@ -141,6 +150,20 @@ class TestInstructionDependencies(unittest.TestCase):
         self.assertTrue(isinstance(mips.pipeline[2].instruction, AddInstruction))
 
 
+class TestMultipleWriters(unittest.TestCase):
+    def setUp(self):
+        self.text = """00100000000000010000000000000001 ; I1: addi R1,R0,1
+                       00100000000000010000000000000010 ; I2: addi R1,R0,2
+                       00000000001000010001000000100000 ; I3: add R2,R1,R1"""
+
+    def test_reader_waits_for_youngest_writer(self):
+        for data_forwarding in (False, True):
+            mips = Mips(self.text, data_forwarding=data_forwarding)
+            mips.run()
+            self.assertEqual(mips.registers[1], 2)
+            self.assertEqual(mips.registers[2], 4)
+
+
 class TestBranching(unittest.TestCase):
     def test_without_branch(self):
         text = '''00100000010000100000000000000101 ; I1: addi R2,R2,5
@@ -228,3 +251,243 @@ class TestEmptyPipelineUntilRunning(unittest.TestCase):
     def test_run(self):
         self.mips.run()
         self.assertEqual(self.mips.clock, 7)
+
+
+class TestIterStates(unittest.TestCase):
+    def setUp(self):
+        self.text = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+                       00100000001000100000000000000010 ; I2: addi R2,R1,2"""
+
+    def test_same_states_as_run(self):
+        mips = Mips(self.text)
+        mips.run()
+        self.assertEqual(list(Mips(self.text).iter_states()), mips.history)
+
+    def test_does_not_keep_history(self):
+        mips = Mips(self.text)
+        for state in mips.iter_states():
+            pass
+        self.assertEqual(mips.history, [])
+        self.assertEqual(mips.registers[2], 5)
+
+    def test_stop_early(self):
+        mips = Mips(self.text)
+        for state in mips.iter_states():
+            if state["clock"] == 3:
+                break
+        self.assertEqual(mips.clock, 3)
+
+
+class TestStatsOnlyRun(unittest.TestCase):
+    def setUp(self):
+        text = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+                  00100000001000100000000000000010 ; I2: addi R2,R1,2
+                  00000000001000100001100000011000 ; I3: mul R3,R1,R2"""
+        self.mips = Mips(text)
+        self.stats = self.mips.run(record_history=False)
+
+    def test_no_history(self):
+        self.assertEqual(self.mips.history, [])
+        self.assertEqual(self.mips.registers[3], 15)
+
+    def test_counters(self):
+        mips = Mips("\n".join(self.mips.instructions))
+        mips.run()
+        self.assertEqual(self.stats["clock"], mips.clock)
+        self.assertEqual(self.stats["instructions_completed"], 3)
+        self.assertEqual(self.stats["cpi"], self.stats["clock"] / 3.0)
+        self.assertEqual(self.stats["throughput"], mips.current_state()["throughput"])
+
+    def test_stalls(self):
+        self.assertTrue(self.stats["stalls"]["data"] > 0)
+        self.assertEqual(self.stats["stalls"]["execute"], 1)
+        self.assertEqual(self.stats["stalls"]["flush"], 0)
+
+    def test_flush(self):
+        text = """00001000000000000000000000001000 ; I1: jmp 8
+                  00100000000000010000000000000011 ; I2: addi R1,R0,3
+                  00100000000000100000000000000011 ; I3: addi R2,R0,3"""
+        stats = Mips(text).run(record_history=False)
+        self.assertEqual(stats["stalls"]["flush"], 2)
+
+
+class TestConfigurations(unittest.TestCase):
+    jumps = """00001000000000000000000000001000 ; I1: jmp 8
+               00100000000000010000000000000011 ; I2: addi R1,R0,3
+               00100000000000100000000000000011 ; I3: addi R2,R0,3"""
+    muls = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+              00000000001000010001100000011000 ; I2: mul R3,R1,R1
+              00000000001000010010000000011000 ; I3: mul R4,R1,R1"""
+
+    def test_mul_latency(self):
+        default = Mips(self.muls).run(record_history=False)
+        for latency in (1, 2, 5):
+            mips = Mips(self.muls, mul_latency=latency)
+            stats = mips.run(record_history=False)
+            self.assertEqual(mips.registers[4], 9)
+            self.assertEqual(stats["stalls"]["execute"], 2 * (latency - 1))
+            self.assertEqual(stats["clock"], default["clock"] + 2 * (latency - 2))
+
+    def test_branch_stall(self):
+        mips = Mips(self.jumps, branch_policy=BRANCH_STALL)
+        stats = mips.run(record_history=False)
+        self.assertEqual(stats["stalls"]["flush"], 0)
+        self.assertEqual(stats["stalls"]["branch"], 2)
+        self.assertEqual(mips.registers[1], 0)
+        self.assertEqual(mips.registers[2], 3)
+        self.assertEqual(stats["instructions_completed"], 2)
+
+    def test_branch_not_taken(self):
+        stats = Mips(self.jumps).run(record_history=False)
+        self.assertEqual(stats["stalls"]["branch"], 0)
+        self.assertEqual(stats["instructions_completed"], 2)
+
+    def test_state_at(self):
+        full = Mips(self.jumps, branch_policy=BRANCH_STALL, mul_latency=3)
+        full.run()
+        mips = Mips(self.jumps, branch_policy=BRANCH_STALL, mul_latency=3, checkpoint_interval=2)
+        mips.run(record_history=False)
+        for cycle, state in enumerate(full.history):
+            self.assertEqual(mips.state_at(cycle), state)
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.text = """00100000000010100000000000000011 ; I1: addi R10,R0,3
+                       10101100000000000000000000011000 ; I2: sw R0,24(R0)
+                       10101100000000000000000000011100 ; I3: sw R0,28(R0)
+                       10001100000001100000000000011100 ; I4: lw R6,28(R0)
+                       00000000110001100011100000011000 ; I5: mul R7,R6,R6
+                       10001100000000010000000000011000 ; I6: lw R1,24(R0)
+                       00000000001001110100100000100000 ; I7: add R9,R1,R7
+                       10101100000010010000000000011000 ; I8: sw R9,24(R0)
+                       00100000110001100000000000000001 ; I9: addi R6,R6,1
+                       10101100000001100000000000011100 ; I10: sw R6,28(R0)
+                       00011100110010100000000000001100 ; I11: ble R6,R10,12"""
+        self.full = Mips(self.text)
+        self.full.run()
+
+    def test_checkpoints_saved(self):
+        mips = Mips(self.text, checkpoint_interval=10)
+        mips.run(record_history=False)
+        self.assertEqual(sorted(mips.checkpoints), range(0, mips.clock, 10))
+
+    def test_state_at(self):
+        for data_forwarding in (False, True):
+            full = Mips(self.text, data_forwarding=data_forwarding)
+            full.run()
+            mips = Mips(self.text, data_forwarding=data_forwarding, checkpoint_interval=10)
+            mips.run(record_history=False)
+            for cycle, state in enumerate(full.history):
+                self.assertEqual(mips.state_at(cycle), state)
+
+    def test_state_at_without_checkpoints(self):
+        mips = Mips(self.text, replayable=True)
+        mips.run(record_history=False)
+        self.assertEqual(mips.state_at(25), self.full.history[25])
+        self.assertRaises(ValueError, self.full.state_at, 25)
+
+    def test_state_at_preloaded_memory(self):
+        text = """10001100000000100000000000000000 ; I1: lw R2,0(R0)
+                  00000000010000100001100000100000 ; I2: add R3,R2,R2
+                  10101100000000110000000000000100 ; I3: sw R3,4(R0)"""
+        descriptor, filename = tempfile.mkstemp()
+        os.close(descriptor)
+        try:
+            with MappedMemory(filename, size=100) as mapped:
+                for memory in (Memory(size=100), mapped):
+                    for options in ({"replayable":True}, {"checkpoint_interval":4}):
+                        memory[0] = 21
+                        memory[4] = 0
+                        mips = Mips(text, memory=memory, **options)
+                        mips.run()
+                        self.assertEqual(mips.registers[3], 42)
+                        for cycle, state in enumerate(mips.history):
+                            self.assertEqual(mips.state_at(cycle), state)
+        finally:
+            os.remove(filename)
+
+    def test_restore_does_not_share_state(self):
+        mips = Mips(self.text, checkpoint_interval=10)
+        mips.run(record_history=False)
+        checkpoint = mips.checkpoints[20]
+        mips.restore(checkpoint)
+        mips.step(100)
+        self.assertEqual(mips.state_at(20), self.full.history[20])
+
+    def test_paged_memory(self):
+        mips = Mips(self.text, checkpoint_interval=10, memory=PagedMemory())
+        mips.run()
+        self.assertEqual(mips.history, self.full.history)
+        self.assertEqual(mips.state_at(35), self.full.history[35])
+
+    def test_mapped_memory(self):
+        descriptor, filename = tempfile.mkstemp()
+        os.close(descriptor)
+        try:
+            with MappedMemory(filename, size=100) as memory:
+                mips = Mips(self.text, checkpoint_interval=10, memory=memory)
+                mips.run()
+                self.assertEqual(mips.history, self.full.history)
+                self.assertEqual(mips.state_at(35), self.full.history[35])
+            self.assertEqual(Memory.load_image(filename)[24], self.full.memory[24])
+        finally:
+            os.remove(filename)
+
+    def test_mapped_image_not_copied(self):
+        descriptor, filename = tempfile.mkstemp()
+        os.close(descriptor)
+        try:
+            # 256 MiB, sparse on disk
+            with MappedMemory(filename, size=64 << 20) as memory:
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                mips = Mips(self.text, memory=memory, replayable=True, checkpoint_interval=10)
+                mips.run()
+                self.assertEqual(mips.state_at(35), self.full.history[35])
+                growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak
+                self.assertTrue(growth < 32 * 1024, growth) # KiB
+        finally:
+            os.remove(filename)
+
+    def test_cycle_not_executed(self):
+        mips = Mips(self.text, checkpoint_interval=10)
+        self.assertRaises(IndexError, mips.state_at, 1)
+
+
+class TestSteadyStateCycle(unittest.TestCase):
+    def setUp(self):
+        text = """00100000000000100111010100110000 ; I1: addi R2,R0,30000
+                  00100000001000010000000000000001 ; I2: addi R1,R1,1
+                  00011100001000100000000000000100 ; I3: ble R1,R2,4"""
+        self.mips = Mips(text)
+        for i in range(100):
+            self.mips.step()
+
+    def test_shared_stall(self):
+        for i in range(10):
+            self.mips.step()
+            for phase in self.mips.pipeline:
+                self.assertTrue(phase.instruction is STALL or not isinstance(phase.instruction, type(STALL)))
+
+    def test_objects_stay_flat(self):
+        gc.collect()
+        gc.disable()
+        try:
+            for i in range(100):
+                self.mips.step()
+            before = len(gc.get_objects())
+            for i in range(1000):
+                self.mips.step()
+            after = len(gc.get_objects())
+        finally:
+            gc.enable()
+        self.assertTrue(after - before < 10)
+
+    def test_in_flight_counter(self):
+        mips = Mips("""00000000000000000000000000000000 ; I1: nop""")
+        self.assertFalse(mips.step())
+        self.assertEqual(mips._in_flight, 1)
+        for i in range(4):
+            self.assertFalse(mips.step())
+        self.assertTrue(mips.step())
+        self.assertEqual(mips._in_flight, 0)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from interpreter import Interpreter
+from functional import FunctionalMips
+from mips import Mips
+from program import Program, is_packed
+
+SOURCE = """addi R1,R0,3
+            jmp END
+            addi R1,R0,5
+            END:
+            mul R2,R1,R1
+            sw R2,24(R0)
+            nop"""
+
+
+def compiled(source=SOURCE):
+    interpreter = Interpreter(source)
+    interpreter.compile()
+    return interpreter
+
+
+class TestProgram(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = compiled()
+        self.program = self.interpreter.program()
+
+    def test_interpreter_program(self):
+        self.assertEqual(list(self.program), self.interpreter.instructions)
+        self.assertEqual(self.program.symbols, {"END":12})
+
+    def test_round_trip(self):
+        data = self.program.to_bytes()
+        self.assertTrue(is_packed(buffer(data)))
+        loaded = Program.from_buffer(buffer(data))
+        self.assertEqual(list(loaded.words), list(self.program.words))
+        self.assertEqual(loaded.texts, self.program.texts)
+        self.assertEqual(loaded.symbols, self.program.symbols)
+
+    def test_without_texts(self):
+        program = Program(self.program.words)
+        loaded = Program.from_buffer(program.to_bytes())
+        self.assertEqual(loaded.texts, [])
+        self.assertEqual(loaded[0], "00100000000000010000000000000011")
+        self.assertEqual(loaded.decode()[0]().text, "")
+
+    def test_high_bit_words(self):
+        program = Program([0xac000018])
+        self.assertEqual(Program.from_buffer(program.to_bytes())[0],
+                         "10101100000000000000000000011000")
+
+    def test_decoded_table(self):
+        data = self.program.pack_decoded()
+        loaded = Program.from_buffer(self.program.to_bytes())
+        self.assertEqual(loaded.load_decoded(data), self.program.decode())
+        self.assertRaises(ValueError, loaded.load_decoded, data[:-4])
+        self.assertRaises(ValueError, loaded.load_decoded,
+                          data.replace("AddiInstruction", "Popen__________"))
+
+    def test_invalid_magic(self):
+        data = "XXXX" + self.program.to_bytes()[4:]
+        self.assertFalse(is_packed(buffer(data)))
+        self.assertRaises(ValueError, Program.from_buffer, data)
+
+    def test_truncated(self):
+        data = self.program.to_bytes()
+        for size in (4, 19, 24, len(data) - 1):
+            self.assertRaises(ValueError, Program.from_buffer, data[:size])
+
+    def test_invalid_lines(self):
+        self.assertRaises(ValueError, Program.from_lines, ["invalid"])
+        self.assertRaises(ValueError, Program.from_lines, ["1" * 33])
+        self.assertRaises(ValueError, Program.from_lines(["1" * 32]).decode)
+        for line in ("1111", "11111100000000000000000000000000 ; unknown"):
+            self.assertRaises(ValueError, Mips, line)
+
+    def test_text_is_not_packed(self):
+        self.assertFalse(is_packed(self.program.to_bytes()))
+        self.assertFalse(is_packed("MIPB"))
+        self.assertFalse(is_packed(str(self.interpreter)))
+        self.assertFalse(is_packed(unicode(self.interpreter)))
+        self.assertFalse(is_packed(None))
+
+
+class TestPackedExecution(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = compiled()
+        self.text = str(self.interpreter)
+        self.data = self.interpreter.program().to_bytes()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameRun(self, source):
+        expected = Mips(self.text)
+        expected.run()
+        mips = Mips(source)
+        mips.run()
+        self.assertEqual(mips.history, expected.history)
+        self.assertEqual(list(mips.instructions), expected.instructions)
+
+    def test_buffer(self):
+        self.assertSameRun(buffer(self.data))
+
+    def test_program(self):
+        self.assertSameRun(Program.from_buffer(self.data))
+
+    def test_file(self):
+        filename = os.path.join(self.directory, "program.bin")
+        self.interpreter.program().dump(filename)
+        self.assertSameRun(Program.load(filename))
+
+    def test_state_at(self):
+        mips = Mips(buffer(self.data), checkpoint_interval=4)
+        mips.run()
+        self.assertEqual(mips.state_at(9), mips.history[9])
+
+    def test_functional(self):
+        mips = FunctionalMips(buffer(self.data))
+        mips.run()
+        self.assertEqual(mips.memory[24], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -59,6 +59,81 @@ class TestTemporaryRegisters(unittest.TestCase):
         self.assertEqual(self.registers._array[3], 2)
 
 
+class TestWordRegisters(unittest.TestCase):
+    def setUp(self):
+        self.registers = Registers()
+
+    def test_wraparound(self):
+        self.registers[1] = 2 ** 31
+        self.assertEqual(self.registers[1], -2 ** 31)
+        self.registers[1] = -2 ** 31 - 1
+        self.assertEqual(self.registers[1], 2 ** 31 - 1)
+
+    def test_forward_and_commit_wrap(self):
+        self.registers.lock(1, self)
+        self.registers.forward(1, 2 ** 32 + 5, self)
+        self.assertEqual(self.registers[1], 5)
+        self.registers.commit(1, 2 ** 32 + 6)
+        self.registers.unlock(1)
+        self.assertEqual(self.registers[1], 6)
+
+    def test_current_state_is_list(self):
+        self.registers[2] = 3
+        state = self.registers.current_state()
+        self.assertEqual(type(state), list)
+        self.assertEqual(state[2], 3)
+
+    def test_snapshot_is_a_copy(self):
+        self.registers[2] = 3
+        snapshot = self.registers.snapshot()
+        self.registers[2] = 4
+        self.registers.restore(snapshot)
+        self.assertEqual(self.registers[2], 3)
+
+
+class TestScoreboard(unittest.TestCase):
+    def setUp(self):
+        self.registers = Registers()
+        self.registers[3] = 4
+        self.older = object()
+        self.younger = object()
+        self.registers.lock(3, self.older)
+        self.registers.lock(3, self.younger)
+
+    def test_not_ready(self):
+        self.assertFalse(self.registers.ready(3))
+        self.assertTrue(self.registers.ready(4))
+
+    def test_ready_after_forward(self):
+        self.registers.forward(3, 7, self.younger)
+        self.assertTrue(self.registers.ready(3))
+        self.assertEqual(self.registers[3], 7)
+
+    def test_older_writer_does_not_forward(self):
+        self.registers.forward(3, 5, self.older)
+        self.assertFalse(self.registers.ready(3))
+
+    def test_older_writer_commit_keeps_register_pending(self):
+        self.registers.forward(3, 7, self.younger)
+        self.registers.commit(3, 5)
+        self.registers.unlock(3)
+        self.assertEqual(self.registers[3], 7)
+        self.assertEqual(self.registers._array[3], 5)
+
+    def test_ready_after_every_writer_unlocks(self):
+        self.registers.commit(3, 5)
+        self.registers.unlock(3)
+        self.assertFalse(self.registers.ready(3))
+        self.registers.commit(3, 7)
+        self.registers.unlock(3)
+        self.assertTrue(self.registers.ready(3))
+        self.assertEqual(self.registers[3], 7)
+
+    def test_unlock_not_locked(self):
+        self.registers.unlock(4)
+        self.assertTrue(self.registers.ready(4))
+
+
 class TestRegisterInUseException(unittest.TestCase):
     def setUp(self):
         self.exception = RegisterInUseException(3)
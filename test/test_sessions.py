@@ -0,0 +1,97 @@
+import threading
+import unittest
+
+from mips import Mips
+from sessions import Session, SessionStore, MAX_STEP_CYCLES
+
+TEXT = """00100000000000010000000000000011 ; I1: addi R1,R0,3
+          00100000001000100000000000000010 ; I2: addi R2,R1,2"""
+FOREVER = "00001000000000000000000000000000 ; I1: jmp 0"
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(TEXT)
+        self.full = Mips(TEXT)
+        self.full.run()
+
+    def test_step(self):
+        states = self.session.step(3)
+        self.assertEqual(states, self.full.history[1:4])
+        self.assertFalse(self.session.finished)
+
+    def test_step_until_finished(self):
+        states = self.session.step(1000)
+        self.assertEqual(states, self.full.history[1:])
+        self.assertTrue(self.session.finished)
+        self.assertEqual(self.session.step(), [])
+
+    def test_step_limit(self):
+        session = Session(FOREVER)
+        self.assertEqual(len(session.step(10 ** 9)), MAX_STEP_CYCLES)
+
+    def test_concurrent_steps(self):
+        session = Session(FOREVER)
+        full = Mips(FOREVER)
+        full.run(life=400)
+        states = []
+        threads = [threading.Thread(target=lambda: states.extend(session.step(100)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(states, key=lambda state: state["clock"]), full.history[1:401])
+
+    def test_state_at(self):
+        self.session.step(5)
+        self.assertEqual(self.session.state_at(2), self.full.history[2])
+        self.assertRaises(IndexError, self.session.state_at, 6)
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = SessionStore(max_sessions=2, idle_timeout=60, clock=self.clock)
+
+    def test_create_and_get(self):
+        key, session = self.store.create(TEXT)
+        self.assertTrue(self.store.get(key) is session)
+
+    def test_unknown_session(self):
+        self.assertRaises(KeyError, self.store.get, "unknown")
+
+    def test_lru_eviction(self):
+        first, _ = self.store.create(TEXT)
+        second, _ = self.store.create(TEXT)
+        self.store.get(first)
+        third, _ = self.store.create(TEXT)
+        self.assertEqual(len(self.store), 2)
+        self.assertTrue(first in self.store)
+        self.assertFalse(second in self.store)
+        self.assertTrue(third in self.store)
+
+    def test_idle_timeout(self):
+        first, _ = self.store.create(TEXT)
+        self.clock.now = 30
+        second, _ = self.store.create(TEXT)
+        self.clock.now = 61
+        self.assertRaises(KeyError, self.store.get, first)
+        self.assertTrue(self.store.get(second))
+
+    def test_delete(self):
+        key, _ = self.store.create(TEXT)
+        self.store.delete(key)
+        self.assertFalse(key in self.store)
+
+
+if __name__ == "__main__":
+    unittest.main()
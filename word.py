@@ -0,0 +1,16 @@
+from array import array
+
+WORD_BITS = 32
+WORD_MASK = (1 << WORD_BITS) - 1
+WORD_SIGN = 1 << (WORD_BITS - 1)
+
+# array typecode holding a signed 32-bit word on this platform
+WORD_TYPECODE = [typecode for typecode in "ilh" if array(typecode).itemsize == 4][0]
+
+
+def to_word(value):
+    """Wrap `value` to a signed 32-bit word, as the hardware would."""
+    return ((value + WORD_SIGN) & WORD_MASK) - WORD_SIGN
+
+def words(size):
+    return array(WORD_TYPECODE, [0]) * size
@@ -8,4 +8,6 @@ sys.path.insert(0, _path)
 import bottle
 import server
 
+# gunicorn imports this module in each worker, before it serves requests
+server.pool.start()
 application = bottle.default_app()